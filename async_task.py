@@ -0,0 +1,181 @@
+import asyncio
+import collections
+import time
+
+import asyncpraw
+from asyncpraw.exceptions import AsyncPRAWException
+from asyncpraw.models import MoreComments
+from asyncprawcore import AsyncPrawcoreException
+
+import logger
+
+from contribution_store import ContributionStore
+from file_cache import FileCache, get_cache_path
+from main import Task
+from submission_cache import SubmissionResolver
+
+"""Asyncio execution engine (`--engine asyncio`).
+
+Scans every configured post under a single event loop instead of one OS thread per post. All tasks
+share one asyncpraw.Reddit instance, and the number of posts (and truncated comment subtrees) being
+fetched at any one time is capped by `--concurrency`.
+"""
+
+class AsyncTask(Task):
+  """Task that fetches and posts with asyncpraw.
+
+  Only the network-bound stages are overridden; the aggregation, sorting and rendering stages are
+  inherited from Task unchanged. Scan state (`--state_path`) is not supported by this engine.
+  """
+  # asyncpraw's stubs don't subclass praw's.
+  more_comments_class = MoreComments
+
+  def __init__(self, vars, reddit, semaphore, resolver=None, subreddit_locks=None, contribution_store=None, posted_responses=None):
+    super().__init__(vars, resolver=resolver, posted_responses=posted_responses, contribution_store=contribution_store)
+    self.reddit = reddit
+    self.semaphore = semaphore
+    # Subreddit -> asyncio.Lock, shared between tasks so that each subreddit is listed by one task at a time.
+    self.subreddit_locks = subreddit_locks if subreddit_locks is not None else collections.defaultdict(asyncio.Lock)
+
+  async def execute(self):
+    """Async equivalent of Task.execute."""
+    logger.log(f"Task starting...", args=self.vars, condition=True)
+    self.vars.start_time = time.time()
+    async with self.semaphore:
+      submission = await self.get_submission()
+      top_level_comments = await self.get_top_level_comments(submission)
+    users_by_name = self.construct_dict_from_top_level_comments(top_level_comments)
+    await self.refresh_truncated_questions(users_by_name)
+    users_by_name = self.scan_replies_to_top_level_comments(users_by_name)
+    if self.contribution_store:
+      self.save_contributions(submission, users_by_name)
+    if self.vars.snapshot_dir:
+      self.write_snapshot(submission, users_by_name)
+    # Short-circuit if there are no user comments in the thread
+    if not users_by_name:
+      logger.log(
+        f"Task finished early due to no user comments in {time.strftime('%Mm%Ss', time.gmtime(time.time() - self.vars.start_time))}",
+        args=self.vars,
+        condition=True)
+      return
+
+    leaderboards = self.get_leaderboards(users_by_name)
+    response = self.construct_response(leaderboards)
+    async with self.semaphore:
+      await self.print_or_post(submission, top_level_comments, response)
+    logger.log(
+      f"Task finished in {time.strftime('%Mm%Ss', time.gmtime(time.time() - self.vars.start_time))}",
+      args=self.vars,
+      condition=True)
+
+  async def get_submission(self):
+    # If a post_id is supplied, retrieve it direcly.
+    if (self.vars.post_id):
+      submission = await self.reddit.submission(id = self.vars.post_id)
+      logger.log("Retrieved submission by ID: %s", self.vars.post_id, args=self.vars)
+      return submission
+
+    # Otherwise, use supplied subreddit and post_regex to find it amongst hot and stickied posts.
+    if (self.vars.subreddit and self.vars.post_regex):
+      submission_id = self.resolver.lookup(self.vars.subreddit, self.vars.post_regex)
+      if submission_id is None:
+        async with self.subreddit_locks[self.vars.subreddit]:
+          submission_id = self.resolver.lookup(self.vars.subreddit, self.vars.post_regex)
+          if submission_id is None:
+            subreddit = await self.reddit.subreddit(self.vars.subreddit)
+            listing = [submission async for submission in subreddit.hot(limit=10)]
+            submission_id = self.resolver.match_listing(self.vars.subreddit, listing, self.vars).get(self.vars.post_regex)
+      if submission_id is not None:
+        logger.log("Resolved submission: %s", submission_id, args=self.vars)
+        return await self.reddit.submission(id = submission_id)
+
+    # Otherwise, throw an error.
+    raise ValueError(
+      f"Unable to find target post. Check the the post_id ({self.vars.post_id}), subreddit ({self.vars.subreddit}), and post_regex ({self.vars.post_regex}) variables.")
+
+  async def get_top_level_comments(self, submission):
+    logger.log(f"Retrieving top-level comments...", args=self.vars)
+    await submission.comments.replace_more(limit=None)
+
+    logger.log("Retrieved %d top-level comments", len(submission.comments), args=self.vars)
+    return submission.comments
+
+  async def refresh_truncated_questions(self, users_by_name):
+    """Concurrently refreshes every question whose replies were truncated, so they can be scanned in memory."""
+    truncated_questions = [
+      self.comment_index[question.id]
+      for user in users_by_name.values()
+      for question in user.questions
+      if any(isinstance(reply, self.more_comments_class) for reply in self.comment_index[question.id].replies)]
+
+    async def refresh(question):
+      async with self.semaphore:
+        logger.log("Refreshing truncated replies to %s", question.permalink, args=self.vars)
+        await question.refresh()
+
+    await asyncio.gather(*[refresh(question) for question in truncated_questions])
+
+  def get_replies(self, question):
+    # Truncated questions were already refreshed by refresh_truncated_questions.
+    return question.replies
+
+  async def print_or_post(self, submission, top_level_comments, response):
+    logger.log("Printing or posting response...", args=self.vars)
+    if self.vars.mode == 'post':
+      await self.post(submission, top_level_comments, response)
+    elif self.vars.mode == 'print':
+      logger.log(f"Printing response: \n{response}", args=self.vars, condition=True)
+      logger.log(f"Response printed at {time.ctime(time.time())}", args=self.vars)
+    else:
+      raise ValueError(f"Unexpected mode ({self.vars.mode}). Should be either `post` or `print`.")
+
+  async def post(self, submission, top_level_comments, response):
+    """Async equivalent of Task.post. The decisions are shared with it (see Task.plan_post)."""
+    logger.log("Posting response...", args=self.vars)
+    steps = self.plan_post(submission, top_level_comments, response)
+    result = None
+    while True:
+      try:
+        action, target = steps.send(result)
+      except StopIteration:
+        return
+      comment = await self.reddit.comment(target, fetch=False) if isinstance(target, str) else target
+      result = None
+      if action == 'edit':
+        try:
+          await comment.edit(response)
+        except (AsyncPRAWException, AsyncPrawcoreException) as e:
+          result = e
+      elif action == 'delete':
+        await comment.delete()
+      else:
+        result = await target.reply(response)
+
+async def run_all(vars, task_vars_list):
+  """Runs an AsyncTask for each entry in task_vars_list and waits for all of them to finish.
+
+  Returns a list of (task_vars, exception) pairs, where exception is None if the task succeeded.
+  """
+  semaphore = asyncio.Semaphore(int(vars.concurrency))
+  contribution_store = ContributionStore(vars.history_path) if vars.history_path else None
+  posted_responses = FileCache(get_cache_path(vars, 'posts'))
+  # Posts in the same subreddit are resolved from a single listing.
+  resolver = SubmissionResolver(vars)
+  for task_vars in task_vars_list:
+    if task_vars.subreddit and task_vars.post_regex:
+      resolver.register(task_vars.subreddit, task_vars.post_regex)
+  subreddit_locks = collections.defaultdict(asyncio.Lock)
+  async with asyncpraw.Reddit(
+      user_agent=vars.user_agent,
+      client_id=vars.client_id,
+      client_secret=vars.client_secret,
+      username=vars.username,
+      password=vars.password,
+      validate_on_submit=True) as reddit:
+    tasks = [
+      AsyncTask(task_vars, reddit, semaphore, resolver, subreddit_locks, contribution_store, posted_responses)
+      for task_vars in task_vars_list]
+    results = await asyncio.gather(*[task.execute() for task in tasks], return_exceptions=True)
+  return [
+    (task_vars, result if isinstance(result, BaseException) else None)
+    for task_vars, result in zip(task_vars_list, results)]
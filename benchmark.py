@@ -0,0 +1,134 @@
+import argparse
+import json
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import fake_reddit
+
+from main import Task
+
+"""Benchmarks the stages of Task against synthetic threads served by fake_reddit.
+
+Prints one JSON object per (size, stage) with the wall time, the number of (fake) API calls and the
+peak memory allocated by that stage. Save the output of two commits and pass one of them to
+--compare to see how the other one changed, e.g.
+
+  $ python3 benchmark.py > before.jsonl
+  $ git checkout my-branch
+  $ python3 benchmark.py --compare before.jsonl
+"""
+
+def get_benchmark_vars(reddit):
+  return argparse.Namespace(
+    username=reddit.username,
+    post_id='fake',
+    subreddit=None,
+    post_regex=None,
+    question_username=None,
+    answer_username=None,
+    print_questions=None,
+    print_answers=None,
+    debug=False,
+    mode='print',
+    comment_mode='edit',
+    interval=600,
+    reply_threshold=3,
+    rankings='most_helpful,under_answered_helpers,relative_contribution',
+    leaderboard_size=10,
+    resolution_ttl=3600,
+    thread_lifetime=86400,
+    cache_dir=None)
+
+def run_stages(num_comments, seed):
+  """Runs each stage of Task once. Yields (stage, seconds, api_calls, peak_bytes) as each stage finishes.
+
+  peak_bytes is only measured while tracemalloc is tracing, and is None otherwise.
+  """
+  reddit = fake_reddit.FakeReddit()
+  fake_reddit.generate_submission(reddit, num_comments, seed=seed)
+  task = Task(get_benchmark_vars(reddit), client_pool=fake_reddit.FakeClientPool(reddit))
+  submission = reddit.submission('fake')
+
+  stages = [
+    ('get_top_level_comments', lambda: task.get_top_level_comments(submission)),
+    ('construct_dict_from_top_level_comments', lambda: task.construct_dict_from_top_level_comments(result)),
+    ('scan_replies_to_top_level_comments', lambda: task.scan_replies_to_top_level_comments(result)),
+    ('get_leaderboards', lambda: task.get_leaderboards(result)),
+    ('construct_response', lambda: task.construct_response(result)),
+  ]
+  result = None
+  for stage, run in stages:
+    api_calls = reddit.num_api_calls()
+    if tracemalloc.is_tracing():
+      tracemalloc.reset_peak()
+      start_bytes = tracemalloc.get_traced_memory()[0]
+    start_time = time.perf_counter()
+    result = run()
+    seconds = time.perf_counter() - start_time
+    peak_bytes = tracemalloc.get_traced_memory()[1] - start_bytes if tracemalloc.is_tracing() else None
+    yield stage, seconds, reddit.num_api_calls() - api_calls, peak_bytes
+
+def benchmark(num_comments, seed):
+  """Returns a result dict for each stage, for a thread with num_comments comments."""
+  results = dict()
+  for stage, seconds, api_calls, _ in run_stages(num_comments, seed):
+    results[stage] = {'size': num_comments, 'stage': stage, 'seconds': seconds, 'api_calls': api_calls}
+
+  # Memory is measured in a separate run, since tracing allocations slows everything down.
+  tracemalloc.start()
+  for stage, _, _, peak_bytes in run_stages(num_comments, seed):
+    results[stage]['peak_bytes'] = peak_bytes
+  tracemalloc.stop()
+  return list(results.values())
+
+def get_commit():
+  try:
+    return subprocess.run(
+      ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+  except (OSError, subprocess.CalledProcessError):
+    return None
+
+def compare(results, baseline_path):
+  """Prints how each result changed relative to the results saved in baseline_path."""
+  with open(baseline_path) as file:
+    baseline = {(r['size'], r['stage']): r for r in map(json.loads, file) if r}
+  print(f"{'size':>7} {'stage':<40} {'seconds':>16} {'api_calls':>16} {'peak_bytes':>16}", file=sys.stderr)
+  for result in results:
+    old = baseline.get((result['size'], result['stage']))
+    if old is None:
+      continue
+    columns = [
+      f"{old[key]:.3g}->{result[key]:.3g}" if isinstance(result[key], float) else f"{old[key]}->{result[key]}"
+      for key in ('seconds', 'api_calls', 'peak_bytes')]
+    print(f"{result['size']:>7} {result['stage']:<40} {columns[0]:>16} {columns[1]:>16} {columns[2]:>16}", file=sys.stderr)
+
+def main(argv):
+  parser = argparse.ArgumentParser()
+  parser.add_argument(
+    "--sizes",
+    default = "1000,10000,100000",
+    help = "Comma-separated numbers of comments in the synthetic threads.")
+  parser.add_argument(
+    "--seed",
+    default = 0,
+    type = int,
+    help = "Seed for generating the synthetic threads.")
+  parser.add_argument(
+    "--compare",
+    help = "Path to the output of a previous run to compare against.")
+  args = parser.parse_args(argv)
+
+  commit = get_commit()
+  results = []
+  for size in map(int, args.sizes.split(',')):
+    for result in benchmark(size, args.seed):
+      result['commit'] = commit
+      print(json.dumps(result), flush=True)
+      results.append(result)
+  if args.compare:
+    compare(results, args.compare)
+
+if __name__ == "__main__":
+  main(sys.argv[1:])
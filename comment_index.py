@@ -0,0 +1,46 @@
+import collections
+
+"""In-memory index of the comments a scan has read.
+
+PRAW comments load related comments lazily: `comment.parent()` fetches the parent if PRAW hasn't
+cached it, and `comment.replies` may refresh the comment. The scan stages read each comment once
+and add it here, so that later parent, child and reply-count lookups (during aggregation, debug
+printing and rendering) are served from memory and never hit the network.
+"""
+
+class CommentIndex:
+  def __init__(self):
+    # Comment id -> PRAW comment
+    self._comments = dict()
+    # Parent fullname -> ids of its indexed children, in the order they were added
+    self._children = collections.defaultdict(list)
+    # Parent fullname -> number of its children that were counted as replies
+    self._num_counted_replies = collections.Counter()
+
+  def add(self, comment, counted=False):
+    """Indexes a comment. `counted` marks replies that passed the scan's filters (see Task.is_counted_reply)."""
+    self._comments[comment.id] = comment
+    self._children[comment.parent_id].append(comment.id)
+    if counted:
+      self._num_counted_replies[comment.parent_id] += 1
+
+  def __getitem__(self, comment_id):
+    return self._comments[comment_id]
+
+  def __contains__(self, comment_id):
+    return comment_id in self._comments
+
+  def __len__(self):
+    return len(self._comments)
+
+  def parent(self, comment):
+    """Returns the indexed parent comment of a comment, or None if it is top-level or wasn't indexed."""
+    return self._comments.get(comment.parent_id[3:]) if comment.parent_id.startswith('t1_') else None
+
+  def children(self, comment):
+    """Returns the indexed direct replies to a comment."""
+    return [self._comments[child_id] for child_id in self._children.get(comment.name, [])]
+
+  def num_counted_replies(self, comment):
+    """Returns the number of direct replies to a comment that were counted."""
+    return self._num_counted_replies[comment.name]
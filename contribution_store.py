@@ -0,0 +1,92 @@
+import sqlite3
+import threading
+import time
+
+"""Persisted per-thread contribution counts, used to rank users across a series of threads.
+
+Every run saves the per-user counts of the thread it scanned, replacing the counts saved by earlier
+runs of the same thread, so once a thread closes its final counts are what remain. A series is the
+target a task was configured with (e.g. a subreddit's daily thread), so that every daily thread
+adds up to the same leaderboard.
+
+Alongside the per-thread counts, the store keeps one row per (series, day, user) with that user's
+totals for the threads created that day. Saving a thread only applies the difference with its
+previously saved counts to those rows, so a leaderboard over the last N days only has to add up N
+rows per user and never touches old comments or old threads.
+"""
+
+SECONDS_PER_DAY = 86400
+
+class ContributionStore:
+  """SQLite-backed store of per-thread and per-day contribution counts."""
+  def __init__(self, path):
+    self.path = path
+    self._lock = threading.Lock()
+    # A single connection is shared by every task (guarded by _lock), like ScanState.
+    self._connection = sqlite3.connect(path, check_same_thread=False)
+    with self._connection as connection:
+      connection.execute(
+        """CREATE TABLE IF NOT EXISTS thread_counts (
+          series TEXT NOT NULL,
+          submission_id TEXT NOT NULL,
+          day INTEGER NOT NULL,
+          user TEXT NOT NULL,
+          num_replies INTEGER NOT NULL,
+          num_questions INTEGER NOT NULL,
+          PRIMARY KEY (series, submission_id, user))""")
+      connection.execute(
+        """CREATE TABLE IF NOT EXISTS daily_counts (
+          series TEXT NOT NULL,
+          day INTEGER NOT NULL,
+          user TEXT NOT NULL,
+          num_replies INTEGER NOT NULL,
+          num_questions INTEGER NOT NULL,
+          PRIMARY KEY (series, day, user))""")
+
+  def save_thread(self, series, submission_id, created_utc, users_by_name):
+    """Replaces the counts saved for a thread and applies the difference to the daily totals."""
+    day = int(created_utc // SECONDS_PER_DAY)
+    counts = {
+      name: (user.num_replies(), len(user.questions))
+      for name, user in users_by_name.items()
+      if user.num_replies() or user.questions}
+    with self._lock, self._connection as connection:
+      previous_counts = {
+        user: (num_replies, num_questions)
+        for user, num_replies, num_questions in connection.execute(
+          "SELECT user, num_replies, num_questions FROM thread_counts WHERE series = ? AND submission_id = ?",
+          (series, submission_id))}
+      deltas = []
+      for user in counts.keys() | previous_counts.keys():
+        num_replies, num_questions = counts.get(user, (0, 0))
+        previous_replies, previous_questions = previous_counts.get(user, (0, 0))
+        if (num_replies, num_questions) != (previous_replies, previous_questions):
+          deltas.append((series, day, user, num_replies - previous_replies, num_questions - previous_questions))
+      connection.executemany(
+        """INSERT INTO daily_counts VALUES (?, ?, ?, ?, ?)
+          ON CONFLICT (series, day, user) DO UPDATE SET
+            num_replies = num_replies + excluded.num_replies,
+            num_questions = num_questions + excluded.num_questions""",
+        deltas)
+      connection.execute(
+        "DELETE FROM thread_counts WHERE series = ? AND submission_id = ?", (series, submission_id))
+      connection.executemany(
+        "INSERT INTO thread_counts VALUES (?, ?, ?, ?, ?, ?)",
+        [(series, submission_id, day, user, num_replies, num_questions)
+          for user, (num_replies, num_questions) in counts.items()])
+
+  def get_most_helpful(self, series, num_days, limit, now=None):
+    """Returns up to `limit` (name, num_replies) pairs for the series' threads from the last num_days days.
+
+    Users are sorted by the number of replies they've made (descending), then by name.
+    """
+    today = int((now if now is not None else time.time()) // SECONDS_PER_DAY)
+    with self._lock:
+      return self._connection.execute(
+        """SELECT user, SUM(num_replies) AS total_replies FROM daily_counts
+          WHERE series = ? AND day > ?
+          GROUP BY user
+          HAVING total_replies > 0
+          ORDER BY total_replies DESC, user
+          LIMIT ?""",
+        (series, today - num_days, limit)).fetchall()
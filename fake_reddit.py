@@ -0,0 +1,287 @@
+import contextlib
+import json
+import random
+import time
+
+from praw.models import MoreComments
+
+"""Offline stand-in for the parts of PRAW that Task uses.
+
+Serves synthetic (see generate_submission) or recorded (see load_submission/record_submission)
+comment trees, and counts every call that would have been an API request on real Reddit. Used by
+benchmark.py to measure Task without hitting the network.
+"""
+
+# Number of top-level comments Reddit returns before hiding the rest behind "load more" stubs.
+INITIAL_TOP_LEVEL_COMMENTS = 200
+# Number of comments revealed by expanding a single "load more" stub.
+COMMENTS_PER_STUB = 100
+
+class FakeRedditor:
+  def __init__(self, name):
+    self.name = name
+
+class FakeCommentForest:
+  def __init__(self, reddit, comments=None):
+    self._reddit = reddit
+    self._comments = comments if comments is not None else []
+
+  def __getitem__(self, index):
+    return self._comments[index]
+
+  def __len__(self):
+    return len(self._comments)
+
+  def list(self):
+    """Returns a flattened list of all comments (including unexpanded stubs)."""
+    comments = []
+    queue = list(self._comments)
+    while queue:
+      comment = queue.pop(0)
+      comments.append(comment)
+      if not isinstance(comment, MoreComments):
+        queue.extend(comment.replies._comments)
+    return comments
+
+  def replace_more(self, limit=32, threshold=0):
+    """Expands "load more" stubs in place, like CommentForest.replace_more. Each expansion is 1 API call."""
+    remaining = limit
+    skipped = []
+    forests = [self]
+    while forests:
+      forest = forests.pop(0)
+      expanded = []
+      for comment in forest._comments:
+        if not isinstance(comment, MoreComments):
+          expanded.append(comment)
+          forests.append(comment.replies)
+        elif (remaining is not None and remaining <= 0) or comment.count < threshold:
+          skipped.append(comment)
+        else:
+          if remaining is not None:
+            remaining -= 1
+          for hidden_comment in comment.comments():
+            expanded.append(hidden_comment)
+            if not isinstance(hidden_comment, MoreComments):
+              forests.append(hidden_comment.replies)
+      forest._comments = expanded
+    return skipped
+
+class FakeMoreComments(MoreComments):
+  """A "load more" stub hiding `comments`. Subclasses MoreComments so isinstance checks keep working."""
+  def __init__(self, reddit, parent_id, comments):
+    super().__init__(reddit, _data={
+      'id': comments[0].id,
+      'name': f"t1_{comments[0].id}",
+      'parent_id': parent_id,
+      'count': len(comments),
+      'children': [comment.id for comment in comments]})
+    self._hidden_comments = comments
+
+  def comments(self, update=True):
+    self._reddit.count_api_call('morechildren')
+    return self._hidden_comments
+
+class FakeComment:
+  def __init__(self, reddit, id, author, parent_id, body, created_utc=0):
+    self._reddit = reddit
+    self.id = id
+    self.name = f"t1_{id}"
+    self.author = FakeRedditor(author) if author else None
+    self.parent_id = parent_id
+    self.body = body
+    self.created_utc = created_utc
+    self.replies = FakeCommentForest(reddit)
+    self.submission = None
+
+  @property
+  def permalink(self):
+    return f"/r/fake/comments/{self.submission.id}/_/{self.id}/"
+
+  def refresh(self):
+    self._reddit.count_api_call('refresh')
+    return self
+
+  def parent(self):
+    if self.parent_id == self.submission.fullname:
+      return self.submission
+    return self._reddit.comments_by_fullname[self.parent_id]
+
+  def edit(self, body):
+    self._reddit.count_api_call('edit')
+    self.body = body
+    return self
+
+  def delete(self):
+    self._reddit.count_api_call('delete')
+    self.author = None
+
+class FakeSubmission:
+  def __init__(self, reddit, id, title, comments):
+    self._reddit = reddit
+    self.id = id
+    self.name = self.fullname = f"t3_{id}"
+    self.title = title
+    self.permalink = f"/r/fake/comments/{id}/"
+    self.created_utc = time.time()
+    self.num_comments = len(comments)
+    self._all_comments = comments
+    self._comments = None
+
+  @property
+  def comments(self):
+    """Builds the comment forest on first access, hiding comments behind stubs the way Reddit does."""
+    if self._comments is None:
+      self._reddit.count_api_call('comments')
+      self._comments = FakeCommentForest(self._reddit, self._build_forest())
+    return self._comments
+
+  def _build_forest(self):
+    children_by_parent = dict()
+    for comment in self._all_comments:
+      comment.submission = self
+      comment.replies = FakeCommentForest(self._reddit)
+      children_by_parent.setdefault(comment.parent_id, []).append(comment)
+    for comment in self._all_comments:
+      comment.replies._comments = list(children_by_parent.get(comment.name, []))
+    top_level_comments = children_by_parent.get(self.fullname, [])
+    visible_comments = top_level_comments[:INITIAL_TOP_LEVEL_COMMENTS]
+    hidden_comments = top_level_comments[INITIAL_TOP_LEVEL_COMMENTS:]
+    for i in range(0, len(hidden_comments), COMMENTS_PER_STUB):
+      visible_comments.append(
+        FakeMoreComments(self._reddit, self.fullname, hidden_comments[i : i + COMMENTS_PER_STUB]))
+    return visible_comments
+
+  def reply(self, body):
+    self._reddit.count_api_call('reply')
+    comment = FakeComment(self._reddit, f"bot{len(self._all_comments)}", self._reddit.username, self.fullname, body)
+    comment.submission = self
+    self._all_comments.append(comment)
+    self._reddit.comments_by_fullname[comment.name] = comment
+    return comment
+
+class FakeSubreddit:
+  def __init__(self, reddit, name):
+    self._reddit = reddit
+    self.display_name = name
+
+  def hot(self, limit=100):
+    self._reddit.count_api_call('hot')
+    return iter([self._reddit.submission(id) for id in list(self._reddit.submissions)[:limit]])
+
+class FakeReddit:
+  """Stands in for praw.Reddit. api_calls maps each kind of request to how many times it was made."""
+  def __init__(self, username='fake_bot'):
+    self.username = username
+    self.submissions = dict()
+    self.comments_by_fullname = dict()
+    self.api_calls = dict()
+
+  def count_api_call(self, kind):
+    self.api_calls[kind] = self.api_calls.get(kind, 0) + 1
+
+  def num_api_calls(self):
+    return sum(self.api_calls.values())
+
+  def add_submission(self, id, title, comment_dicts):
+    """Adds a submission built from dicts with `id`, `author`, `parent_id`, `body` and `created_utc` keys."""
+    comments = [
+      FakeComment(self, c['id'], c['author'], c['parent_id'], c['body'], c.get('created_utc', 0))
+      for c in comment_dicts]
+    for comment in comments:
+      self.comments_by_fullname[comment.name] = comment
+    self.submissions[id] = (title, comments)
+    return self.submission(id)
+
+  def add_comment(self, submission_id, comment_dict):
+    """Adds a comment to an existing submission. It will show up the next time the submission is fetched."""
+    c = comment_dict
+    comment = FakeComment(self, c['id'], c['author'], c['parent_id'], c['body'], c.get('created_utc', 0))
+    self.comments_by_fullname[comment.name] = comment
+    self.submissions[submission_id][1].append(comment)
+    return comment
+
+  def submission(self, id):
+    """Returns a freshly "fetched" submission, like each run of the bot would get from Reddit."""
+    title, comments = self.submissions[id]
+    return FakeSubmission(self, id, title, comments)
+
+  def subreddit(self, name):
+    return FakeSubreddit(self, name)
+
+  def comment(self, id):
+    return self.comments_by_fullname[f"t1_{id}"]
+
+  def info(self, fullnames):
+    """Returns the submissions with the given fullnames, without their comments. 1 API call."""
+    self.count_api_call('info')
+    return iter([self.submission(fullname[3:]) for fullname in fullnames if fullname[3:] in self.submissions])
+
+class FakeClientPool:
+  """Stands in for reddit_client.ClientPool, serving a FakeReddit instead of a real client."""
+  def __init__(self, reddit):
+    self.reddit = reddit
+
+  def get(self):
+    return self.reddit
+
+  def track(self, label):
+    return contextlib.nullcontext()
+
+  def get_usage(self, label):
+    return (self.reddit.num_api_calls(), 0.0, 0.0)
+
+  def usage_summary(self, label):
+    return f"{self.reddit.num_api_calls()} fake API requests"
+
+def generate_comments(num_comments, question_ratio=0.3, num_users=None, seed=0):
+  """Returns dicts describing a synthetic daily thread with num_comments comments.
+
+  About question_ratio of the comments are top-level questions. The rest reply to a random earlier
+  comment, preferring questions, so most of them count as answers.
+  """
+  rng = random.Random(seed)
+  num_users = num_users or max(10, num_comments // 5)
+  comments = []
+  question_ids = []
+  for i in range(num_comments):
+    comment_id = f"c{i}"
+    if not question_ids or rng.random() < question_ratio:
+      parent_id = "t3_fake"
+      question_ids.append(comment_id)
+    elif rng.random() < 0.8:
+      parent_id = f"t1_{rng.choice(question_ids)}"
+    else:
+      parent_id = f"t1_{comments[rng.randrange(len(comments))]['id']}"
+    comments.append({
+      'id': comment_id,
+      'author': f"user{rng.randrange(num_users)}" if rng.random() > 0.02 else None,
+      'parent_id': parent_id,
+      'body': f"Comment {i} " + "lorem ipsum " * rng.randrange(1, 20),
+      'created_utc': 1600000000 + i})
+  return comments
+
+def generate_submission(reddit, num_comments, seed=0):
+  return reddit.add_submission('fake', 'Fake daily thread', generate_comments(num_comments, seed=seed))
+
+def load_submission(reddit, path):
+  """Adds a submission recorded by record_submission to the FakeReddit."""
+  with open(path) as file:
+    recording = json.load(file)
+  return reddit.add_submission(recording['id'], recording['title'], recording['comments'])
+
+def record_submission(submission, path):
+  """Saves a real PRAW submission's comment tree to a JSON file that load_submission can replay."""
+  submission.comments.replace_more(limit=None)
+  with open(path, 'w') as file:
+    json.dump({
+      'id': submission.id,
+      'title': submission.title,
+      'comments': [{
+        'id': comment.id,
+        'author': comment.author.name if comment.author else None,
+        'parent_id': comment.parent_id,
+        'body': comment.body,
+        'created_utc': comment.created_utc,
+      } for comment in submission.comments.list()]
+    }, file)
@@ -0,0 +1,100 @@
+import contextlib
+import json
+import os
+import threading
+
+try:
+  import fcntl
+except ImportError:
+  # Not available on Windows, where processes that share a cache file may overwrite each other's entries.
+  fcntl = None
+
+"""Small thread-safe key/value cache, optionally saved to a JSON file so it survives between runs.
+
+Several processes (e.g. worker processes, or bot instances that share posts with leases.py) may
+share a cache file. Every write locks the file, re-reads it and only changes its own entry, so
+processes never overwrite each other's entries. Reads are served from memory, so an entry another
+process changed is only seen after reload.
+"""
+
+class FileCache:
+  def __init__(self, path=None, mode=None):
+    self.path = path
+    # Permissions of the saved file (e.g. 0o600 for credentials). Defaults to the process's umask.
+    self.mode = mode
+    self._lock = threading.Lock()
+    self._entries = self._load()
+
+  def get(self, key, default=None):
+    with self._lock:
+      return self._entries.get(key, default)
+
+  def set(self, key, value):
+    self._modify(lambda entries: entries.__setitem__(key, value))
+
+  def update(self, entries):
+    self._modify(lambda saved_entries: saved_entries.update(entries))
+
+  def pop(self, key):
+    return self._modify(lambda entries: entries.pop(key, None))
+
+  def reload(self, key):
+    """Replaces the entry in memory with the saved one, which another process may have changed.
+
+    Without a file, the entry is dropped.
+    """
+    with self._lock:
+      entries = self._load()
+      if key in entries:
+        self._entries[key] = entries[key]
+      else:
+        self._entries.pop(key, None)
+
+  def _modify(self, change):
+    """Applies change to the latest saved entries and saves them. Returns change's result."""
+    with self._lock, self._file_lock():
+      if self.path is not None:
+        self._entries = self._load()
+      result = change(self._entries)
+      self._save()
+      return result
+
+  @contextlib.contextmanager
+  def _file_lock(self):
+    """Keeps other processes from writing to the file until the block ends."""
+    if self.path is None or fcntl is None:
+      yield
+      return
+    os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+    with open(f"{self.path}.lock", 'a') as lock_file:
+      fcntl.flock(lock_file, fcntl.LOCK_EX)
+      try:
+        yield
+      finally:
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+  def _load(self):
+    if self.path is None or not os.path.exists(self.path):
+      return dict()
+    try:
+      with open(self.path) as file:
+        return json.load(file)
+    except (OSError, ValueError):
+      # A corrupt cache just means starting from scratch.
+      return dict()
+
+  def _save(self):
+    if self.path is None:
+      return
+    os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+    # Write to a temporary file first, so that a crash never leaves a half-written cache behind.
+    temporary_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temporary_path, 'w') as file:
+      if self.mode is not None:
+        os.chmod(temporary_path, self.mode)
+      json.dump(self._entries, file)
+    os.replace(temporary_path, self.path)
+
+def get_cache_path(vars, name):
+  """Returns the path of the named cache file in --cache_dir, or None if caching to disk is disabled."""
+  return os.path.join(vars.cache_dir, f"{name}.json") if vars.cache_dir else None
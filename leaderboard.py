@@ -0,0 +1,88 @@
+import heapq
+
+import utils
+
+"""Computes the rankings that make up the bot's response.
+
+Every ranking keeps only its top k users in a bounded heap, and all rankings are filled in a single
+pass over the users, so ranking costs O(n log k) no matter how many users take part in a thread.
+Ties are broken in favor of the user that was seen first, just like a stable sort.
+
+Rankings with a `window_days` span every thread of the same series over that many days. They are
+read from the ContributionStore (see contribution_store.py) instead of being computed here.
+"""
+
+class Ranking:
+  """A ranking of users by `key` (descending), only including users for which `include` is true."""
+  def __init__(self, name, title, summarize, key=None, include=None, window_days=None):
+    self.name = name
+    # Heading shown above the ranking in the response.
+    self.title = title
+    self.key = key
+    self.include = include
+    # Renders the ranked users as a Reddit table.
+    self.summarize = summarize
+    # If set, the ranking covers the series' threads from this many days, instead of a single thread.
+    self.window_days = window_days
+
+def get_rankings(names, reply_threshold):
+  """Returns the Rankings with the given names, in the same order."""
+  def has_under_answered_question(user):
+    return any(question.num_replies < reply_threshold for question in user.questions)
+
+  rankings = {
+    'most_helpful': Ranking(
+      name = 'most_helpful',
+      title = "The following users have helped the most people in this thread:",
+      key = lambda user: user.num_replies(),
+      include = lambda user: user.num_replies() > 0,
+      summarize = utils.get_most_helpful_summary),
+    'under_answered_helpers': Ranking(
+      name = 'under_answered_helpers',
+      title = f"The following users have helped the most people in this thread, but have fewer than {reply_threshold} replies to their own question(s):",
+      key = lambda user: user.num_replies(),
+      include = lambda user: user.num_replies() > 0 and has_under_answered_question(user),
+      summarize = lambda users: utils.get_most_helpful_without_replies_summary(users, reply_threshold)),
+    'relative_contribution': Ranking(
+      name = 'relative_contribution',
+      title = "The following users have given the most help, relative to the help they've received:",
+      key = lambda user: user.relative_contribution(),
+      include = lambda user: user.num_replies() > 0,
+      summarize = utils.get_relative_contribution_summary),
+    'weekly_most_helpful': Ranking(
+      name = 'weekly_most_helpful',
+      title = "The following users have helped the most people in the past week's threads:",
+      summarize = utils.get_window_summary,
+      window_days = 7),
+    'monthly_most_helpful': Ranking(
+      name = 'monthly_most_helpful',
+      title = "The following users have helped the most people in the past month's threads:",
+      summarize = utils.get_window_summary,
+      window_days = 30),
+  }
+  for name in names:
+    if name not in rankings:
+      raise ValueError(f"Unexpected ranking ({name}). Should be one of: {', '.join(rankings)}.")
+  return [rankings[name] for name in names]
+
+def compute(users, rankings, k):
+  """Returns a dict mapping(ranking name -> list of its top k Users, best first).
+
+  Rankings with a window_days are skipped.
+  """
+  rankings = [ranking for ranking in rankings if ranking.window_days is None]
+  heaps = {ranking.name: [] for ranking in rankings}
+  for index, user in enumerate(users):
+    for ranking in rankings:
+      if not ranking.include(user):
+        continue
+      # Earlier users win ties, so they get the larger tie-breaker.
+      item = (ranking.key(user), -index, user)
+      heap = heaps[ranking.name]
+      if len(heap) < k:
+        heapq.heappush(heap, item)
+      elif item[:2] > heap[0][:2]:
+        heapq.heapreplace(heap, item)
+  return {
+    name: [user for _, _, user in sorted(heap, key=lambda item: item[:2], reverse=True)]
+    for name, heap in heaps.items()}
@@ -0,0 +1,130 @@
+import contextlib
+import math
+import os
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+
+import logger
+
+"""Lease-based ownership of posts, so that several bot instances can share one list of posts.
+
+Every instance (worker) that is started with the same `--lease_path` registers itself in a shared
+SQLite file and must hold a post's lease before scanning or posting to it. A lease expires
+`lease_ttl` seconds after it was last renewed, and a background thread renews the worker's leases
+while it is alive, so only one worker owns a post at any time and the posts of a worker that dies
+are taken over once its leases expire.
+
+Posts are balanced between the live workers: a worker never claims more than its fair share
+(the number of posts divided by the number of live workers, rounded up). When a new worker joins,
+workers that own more than their share hand their extra posts over, one claim at a time.
+
+Workers on different machines need the SQLite file on a volume they all share.
+"""
+
+class LeaseStore:
+  def __init__(self, path, ttl, num_posts, worker_id=None):
+    self.path = path
+    self.ttl = ttl
+    self.num_posts = num_posts
+    self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+    self._lock = threading.Lock()
+    self._stopped = threading.Event()
+    # Post -> when this worker last acquired its lease (as opposed to renewing it).
+    self.acquired_at = dict()
+    # Transactions are managed explicitly (see _transaction).
+    self._connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+    with self._transaction() as connection:
+      connection.execute(
+        """CREATE TABLE IF NOT EXISTS workers (
+          worker_id TEXT PRIMARY KEY,
+          expires_at REAL NOT NULL)""")
+      connection.execute(
+        """CREATE TABLE IF NOT EXISTS leases (
+          post TEXT PRIMARY KEY,
+          owner TEXT NOT NULL,
+          expires_at REAL NOT NULL)""")
+
+  def start(self):
+    """Registers the worker and starts renewing its leases in the background."""
+    self._renew()
+    threading.Thread(target=self._renew_until_stopped, daemon=True).start()
+
+  def stop(self):
+    """Stops renewing and releases every lease, so other workers can take over right away."""
+    self._stopped.set()
+    with self._transaction() as connection:
+      connection.execute("DELETE FROM leases WHERE owner = ?", (self.worker_id,))
+      connection.execute("DELETE FROM workers WHERE worker_id = ?", (self.worker_id,))
+
+  def claim(self, post):
+    """Acquires or renews the worker's lease on a post. Returns whether the worker owns the post."""
+    now = time.time()
+    with self._transaction() as connection:
+      row = connection.execute("SELECT owner, expires_at FROM leases WHERE post = ?", (post,)).fetchone()
+      num_live_workers, = connection.execute(
+        "SELECT COUNT(*) FROM workers WHERE expires_at > ?", (now,)).fetchone()
+      num_owned, = connection.execute(
+        "SELECT COUNT(*) FROM leases WHERE owner = ? AND expires_at > ?", (self.worker_id, now)).fetchone()
+      fair_share = math.ceil(self.num_posts / max(1, num_live_workers))
+
+      if row is not None and row[1] > now:
+        if row[0] != self.worker_id:
+          return False
+        elif num_owned > fair_share:
+          # Hand the post over to a worker that has fewer than its share.
+          logger.log(f"Releasing {post} to rebalance posts between {num_live_workers} workers.", condition=True)
+          connection.execute("DELETE FROM leases WHERE post = ?", (post,))
+          return False
+      elif num_owned >= fair_share:
+        return False
+      else:
+        self.acquired_at[post] = now
+      connection.execute(
+        "INSERT OR REPLACE INTO leases VALUES (?, ?, ?)", (post, self.worker_id, now + self.ttl))
+      return True
+
+  def holds(self, post):
+    """Returns whether the worker currently holds an unexpired lease on the post."""
+    with self._lock:
+      row = self._connection.execute(
+        "SELECT owner, expires_at FROM leases WHERE post = ?", (post,)).fetchone()
+    return row is not None and row[0] == self.worker_id and row[1] > time.time()
+
+  def release(self, post):
+    with self._transaction() as connection:
+      connection.execute("DELETE FROM leases WHERE post = ? AND owner = ?", (post, self.worker_id))
+
+  def _renew(self):
+    """Extends the worker's registration and its unexpired leases by ttl seconds."""
+    now = time.time()
+    with self._transaction() as connection:
+      connection.execute("INSERT OR REPLACE INTO workers VALUES (?, ?)", (self.worker_id, now + self.ttl))
+      connection.execute(
+        "UPDATE leases SET expires_at = ? WHERE owner = ? AND expires_at > ?",
+        (now + self.ttl, self.worker_id, now))
+
+  def _renew_until_stopped(self):
+    # Renew well before the leases expire, so a slow renewal doesn't lose them.
+    while not self._stopped.wait(self.ttl / 3):
+      try:
+        self._renew()
+      except sqlite3.Error as e:
+        logger.log(f"Failed to renew leases: {e!r}", condition=True)
+
+  @contextlib.contextmanager
+  def _transaction(self):
+    """Runs the block in a transaction that takes the database's write lock up front.
+
+    This serializes concurrent claims, even across processes and machines.
+    """
+    with self._lock:
+      self._connection.execute("BEGIN IMMEDIATE")
+      try:
+        yield self._connection
+      except BaseException:
+        self._connection.execute("ROLLBACK")
+        raise
+      self._connection.execute("COMMIT")
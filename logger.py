@@ -1,25 +1,39 @@
-import inspect
+import atexit
 import datetime
+import json
+import sys
+import threading
+import time
 
 """Args object that returns None for attributes that are not found."""
 class Args(object):
   def __getattr__(self, item):
       return None
 
-"""Conditionally prints a message to the terminal.
+"""Conditionally logs a message.
 
-Message will be printed if either:
+Message will be logged if either:
 - If args.debug = True
 - condition = True
+
+The message is only formatted (with `message % format_args`) if it will actually be logged, so
+messages in hot loops should pass their arguments separately instead of using an f-string:
+`log("Scanning %s", comment.id, args=vars)`.
 """
-def log(message, args = Args(), condition = False):
+def log(message, *format_args, args = Args(), condition = False):
   if args.debug or condition:
-    callerframerecord = inspect.stack()[1]
-    frame = callerframerecord[0]
-    info = inspect.getframeinfo(frame)
-    time = datetime.datetime.now().strftime("%m/%d/%Y %H:%M:%S")
-    post_info = get_post_info(args)
-    print(f"[{time}]{post_info}[{info.filename}][{info.function}:{info.lineno}] {message}")
+    # sys._getframe is far cheaper than inspect.stack(), which reads source files from disk.
+    frame = sys._getframe(1)
+    if format_args:
+      message = message % format_args
+    _sink.write({
+      'time': datetime.datetime.now().strftime("%m/%d/%Y %H:%M:%S"),
+      'post': get_post_info(args),
+      'file': frame.f_code.co_filename,
+      'function': frame.f_code.co_name,
+      'line': frame.f_lineno,
+      'message': message,
+    }, flush = condition)
 
 def get_post_info(args):
   if args.post_id:
@@ -27,4 +41,65 @@ def get_post_info(args):
   elif args.subreddit and args.post_regex:
     return f"[{args.subreddit}?regex={args.post_regex}]"
   # Unexpected.
-  return ""
\ No newline at end of file
+  return ""
+
+def configure(format = 'text'):
+  """Sets how records are written: `text` (human-readable lines) or `json` (one JSON object per line)."""
+  if format not in ('text', 'json'):
+    raise ValueError(f"Unexpected log_format ({format}). Should be either `text` or `json`.")
+  _sink.format = format
+
+def flush():
+  _sink.flush()
+
+class _Sink:
+  """Thread-safe, buffered writer shared by every task.
+
+  Debug records are buffered and written in batches, at most MAX_BUFFERED_SECONDS after they were
+  logged. Records that are always logged (condition=True) flush the buffer immediately, so important
+  messages are never delayed.
+  """
+  MAX_BUFFERED_RECORDS = 100
+  MAX_BUFFERED_SECONDS = 1
+
+  def __init__(self, stream):
+    self.stream = stream
+    self.format = 'text'
+    self._buffer = []
+    self._flushed_at = time.monotonic()
+    self._lock = threading.Lock()
+    # Flushes the buffer if nothing else does within MAX_BUFFERED_SECONDS.
+    self._timer = None
+
+  def write(self, record, flush = False):
+    line = self._format(record)
+    with self._lock:
+      self._buffer.append(line)
+      if (flush
+          or len(self._buffer) >= self.MAX_BUFFERED_RECORDS
+          or time.monotonic() - self._flushed_at >= self.MAX_BUFFERED_SECONDS):
+        self._flush()
+      # Timers don't survive a fork, so a child process may inherit one that will never fire.
+      elif self._timer is None or not self._timer.is_alive():
+        self._timer = threading.Timer(self.MAX_BUFFERED_SECONDS, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+  def flush(self):
+    with self._lock:
+      self._flush()
+
+  def _flush(self):
+    if self._buffer:
+      self.stream.write('\n'.join(self._buffer) + '\n')
+      self.stream.flush()
+      self._buffer = []
+    self._flushed_at = time.monotonic()
+
+  def _format(self, record):
+    if self.format == 'json':
+      return json.dumps(record)
+    return f"[{record['time']}]{record['post']}[{record['file']}][{record['function']}:{record['line']}] {record['message']}"
+
+_sink = _Sink(sys.stdout)
+atexit.register(flush)
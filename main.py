@@ -1,98 +1,228 @@
+import asyncio
+import collections
 import copy
-import praw
+import hashlib
+import heapq
+import itertools
+import multiprocessing
+import os
+import queue
+import signal
 import sys
 import threading
 import time
-import re
 
+import leaderboard
 import logger
+import metrics
+import snapshot
 import utils
 import var_utils
 
-from user import User
+from comment_index import CommentIndex
+from contribution_store import ContributionStore
+from file_cache import FileCache, get_cache_path
+from leases import LeaseStore
+from praw.exceptions import PRAWException
+from praw.models import MoreComments
+from prawcore import PrawcoreException
+from reddit_client import ClientPool
+from scan_state import BOT, IGNORED, QUESTION, REPLY, ScanState
+from scheduler import Scheduler
+from stream import Streamer
+from submission_cache import SubmissionResolver
+from user import Contribution, User
 
 class Task:
-  def __init__(self, vars):
+  # Class of the "load more" stubs in comment forests. Overridden by engines that use another Reddit client.
+  more_comments_class = MoreComments
+
+  def __init__(self, vars, scan_state=None, client_pool=None, resolver=None, posted_responses=None, contribution_store=None, fingerprints=None, leases=None):
     self.vars = vars
+    self.scan_state = scan_state
+    # Per-thread counts saved for cross-thread rankings (see contribution_store.py).
+    self.contribution_store = contribution_store
+    self.client_pool = client_pool or ClientPool(vars)
+    self.resolver = resolver or SubmissionResolver(vars)
+    # Submission id -> the bot's comment id and a hash of the response it posted (see post).
+    self.posted_responses = posted_responses or FileCache(get_cache_path(vars, 'posts'))
+    # Submission id -> fingerprint of the thread when it was last fully processed (see get_fingerprint).
+    self.fingerprints = fingerprints or FileCache(get_cache_path(vars, 'fingerprints'))
+    # Shared with other workers when several instances split the posts (see leases.py).
+    self.leases = leases
+    # When this task last saw its post's lease being acquired (see reload_cached_post).
+    self.lease_acquired_at = None
+    # Id of the submission the latest scan_new_comments scanned, whose state is kept in memory.
+    self.scanned_submission_id = None
+    self.metrics = metrics.RunMetrics(logger.get_post_info(vars), self.client_pool)
+    # Number of "load more" stubs the latest scan ran out of budget for (see get_new_comments).
+    self.num_unexpanded_stubs = 0
+    # Seconds until the next run, shown in the response. Adjusted by the Scheduler in daemon mode.
+    self.interval = int(vars.interval)
+    # (time, number of comments in the thread) as of the latest successful run, used by the Scheduler
+    # to measure how active the thread is.
+    self.comment_count = None
 
   def execute(self):
     """Top-level task definition.
 
-    Scans a reddit thread, organizes users by contribution, then posts/prints the results.
+    Scans a reddit thread, organizes users by contribution, then posts/prints the results. The run's
+    metrics are written whether it succeeds or not.
     """
-    logger.log(f"Task starting...", self.vars, True)
+    logger.log(f"Task starting...", args=self.vars, condition=True)
     self.vars.start_time = time.time()
+    # Attribute this task's API requests to its post, so its share of the quota can be reported.
+    label = logger.get_post_info(self.vars)
+    self.metrics = metrics.RunMetrics(label, self.client_pool)
+    self.num_unexpanded_stubs = 0
+    try:
+      with self.client_pool.track(label):
+        self.metrics.status = self.scan_and_respond(label)
+    except BaseException as e:
+      self.metrics.fail(e, 'timeout' if isinstance(e, TaskTerminated) else 'failed')
+      raise
+    finally:
+      self.metrics.emit(self.vars.metrics_path, self.vars.metrics_format, getattr(self, 'reddit', None))
+
+  def scan_and_respond(self, label):
+    """Runs the stages of execute. Returns the run's status (see metrics.py)."""
+    if self.leases and not self.leases.claim(label):
+      logger.log("Another worker owns this post. Skipping.", args=self.vars, condition=True)
+      return 'not_owner'
     submission = self.get_submission()
-    top_level_comments = self.get_top_level_comments(submission)    
-    users_by_name = self.construct_dict_from_top_level_comments(top_level_comments)
+    if self.leases and self.leases.acquired_at.get(label) != self.lease_acquired_at:
+      self.lease_acquired_at = self.leases.acquired_at.get(label)
+      self.reload_cached_post(submission)
+    fingerprint = self.get_fingerprint(submission) if self.vars.skip_unchanged else None
+    if fingerprint is not None and self.fingerprints.get(submission.id) == fingerprint:
+      self.comment_count = (time.time(), fingerprint['num_comments'])
+      logger.log(
+        f"Task finished early because the thread hasn't changed since the last run. {self.client_pool.usage_summary(label)}",
+        args=self.vars,
+        condition=True)
+      return 'unchanged'
+    if self.scan_state:
+      top_level_comments, users_by_name = self.scan_new_comments(submission)
+    else:
+      top_level_comments = self.get_top_level_comments(submission)
+      users_by_name = self.construct_dict_from_top_level_comments(top_level_comments)
+      users_by_name = self.scan_replies_to_top_level_comments(users_by_name)
+    self.metrics.count('users', len(users_by_name))
+    self.metrics.count('questions', sum(len(user.questions) for user in users_by_name.values()))
+    self.metrics.count('replies', sum(len(user.replies) for user in users_by_name.values()))
+    self.metrics.count('unexpanded_stubs', self.num_unexpanded_stubs)
+    # Fetching the comments also fetched the submission's metadata, so this doesn't make a request.
+    self.comment_count = (time.time(), submission.num_comments)
+    if self.contribution_store:
+      self.save_contributions(submission, users_by_name)
+    if self.vars.snapshot_dir:
+      self.write_snapshot(submission, users_by_name)
     # Short-circuit if there are no user comments in the thread
     if not users_by_name:
+      self.remember_fingerprint(submission, fingerprint)
       logger.log(
-        f"Task finished early due to no user comments in {time.strftime('%Mm%Ss', time.gmtime(time.time() - self.vars.start_time))}",
-        self.vars,
-        True)
-      return
-    
-    users_by_name = self.scan_replies_to_top_level_comments(users_by_name)    
-    users_sorted_by_replies = self.get_users_sorted_by_replies(users_by_name)
-    response = self.construct_response(users_sorted_by_replies)    
-    self.print_or_post(submission, top_level_comments, response)
+        f"Task finished early due to no user comments in {time.strftime('%Mm%Ss', time.gmtime(time.time() - self.vars.start_time))}. {self.client_pool.usage_summary(label)}",
+        args=self.vars,
+        condition=True)
+      return 'no_users'
+
+    self.respond(submission, top_level_comments, users_by_name)
+    self.remember_fingerprint(submission, fingerprint)
     logger.log(
-      f"Task finished in {time.strftime('%Mm%Ss', time.gmtime(time.time() - self.vars.start_time))}",
-      self.vars,
-      True)
+      f"Task finished in {time.strftime('%Mm%Ss', time.gmtime(time.time() - self.vars.start_time))}. {self.client_pool.usage_summary(label)}",
+      args=self.vars,
+      condition=True)
+    return 'ok'
+
+  def record_timeout(self, error):
+    """Writes the metrics of a run that is still going after --task_timeout.
+
+    The run's thread can't be stopped, so it still writes its own metrics if it finishes later.
+    """
+    timed_out = self.metrics.copy()
+    timed_out.fail(error, 'timeout')
+    timed_out.emit(self.vars.metrics_path, self.vars.metrics_format, getattr(self, 'reddit', None))
 
+  def reload_cached_post(self, submission):
+    """Reloads what the caches know about the submission, after this worker (re)acquired its lease.
+
+    Another worker may have owned the post since this task last ran, and posted or scanned it since.
+    """
+    self.posted_responses.reload(submission.id)
+    self.fingerprints.reload(submission.id)
+
+  @metrics.timed
+  def get_fingerprint(self, submission):
+    """Returns cheap metadata that changes whenever a comment is added to the thread, or None.
+
+    Only fetches the submission's metadata (/api/info), unlike fetching the submission itself, which
+    also returns its comments. The settings that shape the response are included, so that changing
+    them isn't mistaken for an unchanged thread.
+    """
+    logger.log("Fetching thread fingerprint...", args=self.vars)
+    info = next(iter(self.reddit.info(fullnames=[submission.fullname])), None)
+    if info is None:
+      return None
+    return {
+      'num_comments': info.num_comments,
+      'settings': [
+        self.vars.rankings,
+        self.vars.reply_threshold,
+        self.vars.leaderboard_size,
+        utils.get_human_readable_time(self.interval)],
+    }
+
+  def remember_fingerprint(self, submission, fingerprint):
+    """Saves the fingerprint of a thread that was fully processed, so the next run can skip it if it's unchanged."""
+    # Partial results still have comments to expand, so they are never skipped.
+    if fingerprint is not None and not self.num_unexpanded_stubs:
+      self.fingerprints.set(submission.id, fingerprint)
+
+  def respond(self, submission, top_level_comments, users_by_name):
+    """Ranks the users, then posts/prints the response."""
+    leaderboards = self.get_leaderboards(users_by_name)
+    response = self.construct_response(leaderboards)
+    self.print_or_post(submission, top_level_comments, response)
+
+  @metrics.timed
   def get_submission(self):
-    reddit_instance = praw.Reddit(
-      user_agent=self.vars.user_agent,
-      client_id=self.vars.client_id,
-      client_secret=self.vars.client_secret,
-      username=self.vars.username,
-      password=self.vars.password,
-      validate_on_submit=True)
+    self.reddit = reddit_instance = self.client_pool.get()
 
     # If a post_id is supplied, retrieve it direcly.
     if (self.vars.post_id):
       submission = reddit_instance.submission(id = self.vars.post_id)
-      logger.log(f"Retrieved submission by ID: {self.vars.post_id}", self.vars)
+      logger.log("Retrieved submission by ID: %s", self.vars.post_id, args=self.vars)
       return submission
     
     # Otherwise, use supplied subreddit and post_regex to find it amongst hot and stickied posts.
     if (self.vars.subreddit and self.vars.post_regex):
-      subreddit = reddit_instance.subreddit(self.vars.subreddit)
-      for submission in subreddit.hot(limit=10):
-        if re.search(self.vars.post_regex, submission.title):
-          logger.log(f"Successfully found submission: {submission.title} ({submission.permalink})", self.vars)
-          return submission
+      submission = self.resolver.resolve(reddit_instance, self.vars.subreddit, self.vars.post_regex, self.vars)
+      if submission is not None:
+        return submission
 
     # Otherwise, throw an error.
     raise ValueError(
       f"Unable to find target post. Check the the post_id ({self.vars.post_id}), subreddit ({self.vars.subreddit}), and post_regex ({self.vars.post_regex}) variables.")
 
+  @metrics.timed
   def get_top_level_comments(self, submission):
-    logger.log(f"Retrieving top-level comments...", self.vars)
+    logger.log(f"Retrieving top-level comments...", args=self.vars)
     submission.comments.replace_more(limit=None)
     
-    logger.log(f"Retrieved {submission.comments.__len__()} top-level comments", self.vars)
+    logger.log("Retrieved %d top-level comments", len(submission.comments), args=self.vars)
     return submission.comments
 
+  @metrics.timed
   def construct_dict_from_top_level_comments(self, top_level_comments):
     """Scans the top-level comments and constructs a dictionary mapping(name -> User)."""
-    logger.log(f"Constructing a username dictionary from top-level comments...", self.vars)
-    bot_username = self.vars.username
-    question_username = self.vars.question_username
+    logger.log(f"Constructing a username dictionary from top-level comments...", args=self.vars)
     print_questions = self.vars.print_questions
 
     users_by_name = dict()
+    # The PRAW comments behind each Contribution, for the stages that still need to read them.
+    self.comment_index = CommentIndex()
     for comment in top_level_comments:
-      # Ignore comments that have been deleted.
-      if comment.author is None:
-        continue
-      # Ignore comments made by the bot, itself.
-      elif comment.author.name == bot_username:
-        continue
-      # Command-line specified a question_username => ignore other users' questions.
-      elif question_username and comment.author.name != question_username:
+      if not self.is_counted_question(comment):
         continue
       else:
         # This is a real user => check if we've already encountered them then update the dict with their question.
@@ -105,24 +235,29 @@ class Task:
           user = User(name=username, questions=[])
         # Add the updated User object to our dict.
         user = users_by_name.get(username, User(name=username, questions=[]))
-        user.add_question(comment)
+        user.add_question(Contribution.from_comment(comment))
+        self.comment_index.add(comment)
         users_by_name[username] = user
 
     if print_questions:
+      logger.flush()
       print('\n----Questions----')
       for username in users_by_name.keys():
         print(f"User: {username}")
         for question in users_by_name.get(username).questions:
-          print(f"\t{utils.get_abbreviated_comment(question)}")
+          print(f"\t{utils.get_abbreviated_comment(self.comment_index[question.id])}")
           
-    logger.log(f"Dictionary includes {len(users_by_name)} users", self.vars)
+    logger.log("Dictionary includes %d users", len(users_by_name), args=self.vars)
     return users_by_name
 
+  @metrics.timed
   def scan_replies_to_top_level_comments(self, users_by_name):
-    """Scans replies to top-level comments and updates the users_by_name dict."""
-    logger.log(f"Scanning replies to top-level comments...", self.vars)
-    bot_username = self.vars.username
-    answer_username = self.vars.answer_username
+    """Scans replies to top-level comments and updates the users_by_name dict.
+
+    Replies are read from the comment forest already expanded by get_top_level_comments, so each
+    question only costs an API call if its reply tree was truncated.
+    """
+    logger.log(f"Scanning replies to top-level comments...", args=self.vars)
     print_answers = self.vars.print_answers
 
     repliers_by_name = dict()
@@ -130,33 +265,35 @@ class Task:
       requestor = users_by_name.get(username)
       questions = requestor.questions
       for question in questions:
-        replies = question.refresh().replies
+        question_comment = self.comment_index[question.id]
+        replies = self.get_replies(question_comment)
         for reply in replies:
-          if reply.author is None:
-            # Ignore deleted responses
-            continue
-          elif reply.author.name == bot_username:
-            # Ignore any reply by the bot.
+          if isinstance(reply, self.more_comments_class):
             continue
-          elif answer_username and reply.author.name != answer_username:
-            # Command-line specified an answer_username => ignore other users answers.
+          elif not self.is_counted_reply(reply):
+            self.comment_index.add(reply)
             continue
           else:
+            self.comment_index.add(reply, counted=True)
             # Update the requestor to track the number of replies they've received
             requestor.inc_num_replies_to_questions()
             # Update the replier to track their contributions
             replier_name = reply.author.name
             replier = repliers_by_name.get(replier_name, User(name=replier_name, questions=[], replies=[]))
-            replier.add_reply(reply)
+            replier.add_reply(Contribution.from_comment(reply))
             repliers_by_name[replier_name] = replier
+        question.num_replies = self.comment_index.num_counted_replies(question_comment)
 
     if print_answers:
+      logger.flush()
       print('\n----Answers----')
       for username in repliers_by_name.keys():
         print(f"User: {username}")
-        for reply in repliers_by_name.get(username).replies:
+        for contribution in repliers_by_name.get(username).replies:
+          reply = self.comment_index[contribution.id]
+          question = self.comment_index.parent(reply)
           print(f"\t{utils.get_abbreviated_comment(reply)}")
-          print(f"\t\t(answers) - {reply.parent().author.name} - {utils.get_abbreviated_comment(reply.parent())}")
+          print(f"\t\t(answers) - {question.author.name} - {utils.get_abbreviated_comment(question)}")
 
     # Combine the 2 dictionaries
     for username in repliers_by_name:
@@ -168,46 +305,250 @@ class Task:
       else:
         users_by_name[username] = replier
 
-    logger.log(f"Found replies from {len(repliers_by_name)} users", self.vars)
-    logger.log(f"Dictionary now includes {len(users_by_name)} users", self.vars)
+    logger.log("Found replies from %d users", len(repliers_by_name), args=self.vars)
+    logger.log("Dictionary now includes %d users", len(users_by_name), args=self.vars)
 
     return users_by_name
 
-  def get_users_sorted_by_replies(self, users_by_name):
-    """Returns a list of Users, sorted by the answers they've contributed (descending).
+  def is_counted_question(self, comment):
+    """Returns whether a top-level comment should be counted as a question."""
+    # Ignore comments that have been deleted.
+    if comment.author is None:
+      return False
+    # Ignore comments made by the bot, itself.
+    elif comment.author.name == self.vars.username:
+      return False
+    # Command-line specified a question_username => ignore other users' questions.
+    elif self.vars.question_username and comment.author.name != self.vars.question_username:
+      return False
+    return True
+
+  def is_counted_reply(self, reply):
+    """Returns whether a reply to a counted question should be counted as an answer."""
+    # Ignore deleted responses
+    if reply.author is None:
+      return False
+    # Ignore any reply by the bot.
+    elif reply.author.name == self.vars.username:
+      return False
+    # Command-line specified an answer_username => ignore other users answers.
+    elif self.vars.answer_username and reply.author.name != self.vars.answer_username:
+      return False
+    return True
 
-    Filters any users that have not contributed anything.
+  def get_replies(self, question):
+    """Returns the direct replies to a question, only refreshing it if its replies were truncated."""
+    replies = question.replies
+    if any(isinstance(reply, self.more_comments_class) for reply in replies):
+      logger.log("Refreshing truncated replies to %s", question.permalink, args=self.vars)
+      replies = question.refresh().replies
+    return replies
+
+  @metrics.timed
+  def scan_new_comments(self, submission):
+    """Folds comments that previous runs haven't seen into the saved scan state.
+
+    Returns the bot's own top-level comments and a dictionary mapping(name -> User) that covers every
+    comment seen in the thread so far. Counts are never decremented, so comments deleted after they
+    were first scanned are still counted.
     """
-    logger.log("Sorting users by how many replies they've made...", self.vars)
-    users = [user for user in list(users_by_name.values()) if user.num_replies() > 0]
-    users.sort(key=lambda user: user.num_replies(), reverse=True)
-    return users
-
-  def construct_response(self, users_sorted_by_replies):
-    logger.log("Constructing response...", self.vars)
-    interval = int(self.vars.interval)
+    logger.log(f"Scanning new comments...", args=self.vars)
+    if self.scanned_submission_id not in (None, submission.id):
+      # The target was replaced by a newer thread, so the old thread's state won't be used again.
+      self.scan_state.evict(self.scanned_submission_id)
+    self.scanned_submission_id = submission.id
+    state = self.scan_state.load(submission.id)
+    new_comments = self.get_new_comments(submission, state)
+    self.fold_comments(state, submission.fullname, new_comments)
+    self.scan_state.save(state)
+
+    logger.log("Folded in %d new comments (%d seen in total)", len(new_comments), len(state.seen_comment_ids), args=self.vars)
+    bot_comments = [self.reddit.comment(comment_id) for comment_id in state.bot_comment_ids]
+    return bot_comments, state.to_users()
+
+  def fold_comments(self, state, submission_fullname, new_comments):
+    """Folds comments that the SubmissionState hasn't seen yet into it, using the same rules as a full scan."""
+    # Fold in top-level comments first, so that new replies to new questions are recognized.
+    for comment in new_comments:
+      if comment.parent_id != submission_fullname:
+        continue
+      elif self.is_counted_question(comment):
+        state.add(QUESTION, Contribution.from_comment(comment))
+      elif comment.author is not None and comment.author.name == self.vars.username:
+        state.add(BOT, Contribution.from_comment(comment))
+      else:
+        state.add(IGNORED, Contribution(comment.id))
+    for comment in new_comments:
+      if comment.parent_id == submission_fullname:
+        continue
+      elif state.is_question(comment.parent_id) and self.is_counted_reply(comment):
+        state.add(REPLY, Contribution.from_comment(comment))
+      else:
+        state.add(IGNORED, Contribution(comment.id))
+
+  def get_new_comments(self, submission, state):
+    """Returns a flat list of the comments in the thread that previous scans haven't seen.
+
+    Each "load more" expansion costs an API call, so stubs are expanded in priority order:
+    1. Stubs hiding unseen replies to questions with fewer than reply_threshold replies.
+    2. Stubs hiding other unseen comments, newest first.
+    3. Stubs whose comments were all seen. A stub only lists the ids of the comments it hides, not
+       the replies nested under them, so these may still hide new replies. They are only expanded
+       while the thread has more comments (submission.num_comments) than have been seen, least
+       recently expanded first, so a thread that hasn't changed only costs a single request.
+    When --max_expansions or --max_expansion_seconds is set, expansion stops once the budget runs
+    out, and left-over stubs are expanded by later runs. The number of them that hide unseen
+    comments (which makes the results partial) is saved in self.num_unexpanded_stubs.
+    """
+    seen_comment_ids = set(state.seen_comment_ids)
     reply_threshold = int(self.vars.reply_threshold)
+    max_expansions = int(self.vars.max_expansions) if self.vars.max_expansions else None
+    deadline = (time.monotonic() + float(self.vars.max_expansion_seconds)
+      if self.vars.max_expansion_seconds else None)
+    new_question_ids = set()
+
+    def hides_unseen_comments(stub):
+      # "Continue this thread" stubs don't list their children, so they may hide unseen comments.
+      return not stub.children or not seen_comment_ids.issuperset(stub.children)
+
+    def get_priority(stub):
+      question_id = stub.parent_id[3:]
+      question = state.questions.get(question_id)
+      if not hides_unseen_comments(stub):
+        return (2, state.stub_expansion_times.get(stub.id, 0))
+      elif question_id in new_question_ids or (question is not None and question.num_replies < reply_threshold):
+        return (0, 0)
+      # Comment ids are base 36 and increase over time, so the largest one is the newest comment.
+      return (1, -max((int(child_id, 36) for child_id in stub.children), default=0))
+
+    new_comments = []
+    # Heap of (priority, insertion order, stub). The insertion order keeps stubs from being compared.
+    stubs = []
+    insertion_order = itertools.count()
+    num_expansions = 0
+    pending_comments = collections.deque(submission.comments)
+    while pending_comments or stubs:
+      if not pending_comments:
+        if stubs[0][0][0] == 2 and len(seen_comment_ids) >= submission.num_comments:
+          # Every comment in the thread has been seen, so the remaining stubs hide nothing new.
+          break
+        # At least one stub is expanded per run, so that repeated runs always make progress.
+        if num_expansions and (
+            (max_expansions is not None and num_expansions >= max_expansions)
+            or (deadline is not None and time.monotonic() >= deadline)):
+          break
+        _, _, stub = heapq.heappop(stubs)
+        num_expansions += 1
+        state.stub_expansion_times[stub.id] = time.time()
+        pending_comments.extend(stub.comments())
+        continue
+      comment = pending_comments.popleft()
+      if isinstance(comment, self.more_comments_class):
+        heapq.heappush(stubs, (get_priority(comment), next(insertion_order), comment))
+      elif comment.id not in seen_comment_ids:
+        seen_comment_ids.add(comment.id)
+        new_comments.append(comment)
+        if comment.parent_id == submission.fullname:
+          new_question_ids.add(comment.id)
+        pending_comments.extend(comment.replies)
+      else:
+        pending_comments.extend(comment.replies)
+
+    self.num_unexpanded_stubs = sum(1 for _, _, stub in stubs if hides_unseen_comments(stub))
+    if stubs:
+      logger.log(
+        f"Expansion budget ran out after {num_expansions} \"load more\" stubs. {len(stubs)} stubs ({self.num_unexpanded_stubs} hiding unseen comments) will be expanded by later runs.",
+        args=self.vars,
+        condition=True)
+    return new_comments
 
-    return (f"\nResults will update every ~{utils.get_human_readable_time(interval)}.\n"
-      "\n-----\n"
-      "\nThe following users have helped the most people in this thread:\n"
-      f"\n{utils.get_most_helpful_summary(users_sorted_by_replies)}\n"
-      "\n-----\n"
-      f"\nThe following users have helped the most people in this thread, but have fewer than {reply_threshold} replies to their own question(s):\n"
-      f"\n{utils.get_most_helpful_without_replies_summary(users_sorted_by_replies, reply_threshold)}\n")
+  @metrics.timed
+  def save_contributions(self, submission, users_by_name):
+    """Saves the thread's per-user counts, replacing the ones saved by earlier runs."""
+    logger.log("Saving contributions...", args=self.vars)
+    self.contribution_store.save_thread(
+      logger.get_post_info(self.vars), submission.id, submission.created_utc, users_by_name)
 
+  @metrics.timed
+  def write_snapshot(self, submission, users_by_name):
+    """Writes the thread's question/reply graph to --snapshot_dir, replacing the previous run's snapshot."""
+    logger.log("Writing snapshot...", args=self.vars)
+    snapshot.write(
+      os.path.join(self.vars.snapshot_dir, f"{submission.id}.snapshot"), submission.id, users_by_name)
+
+  @metrics.timed
+  def get_leaderboards(self, users_by_name):
+    """Returns a list of (Ranking, top users) pairs, one for each of the configured --rankings.
+
+    Rankings that span several threads list (name, num_replies) pairs read from the contribution
+    store, instead of Users.
+    """
+    logger.log("Ranking users...", args=self.vars)
+    size = int(self.vars.leaderboard_size)
+    rankings = leaderboard.get_rankings(
+      self.vars.rankings.split(','), int(self.vars.reply_threshold))
+    top_users = leaderboard.compute(users_by_name.values(), rankings, size)
+    for ranking in rankings:
+      if ranking.window_days is None:
+        continue
+      elif not self.contribution_store:
+        raise ValueError(f"The {ranking.name} ranking requires --history_path to be set.")
+      top_users[ranking.name] = self.contribution_store.get_most_helpful(
+        logger.get_post_info(self.vars), ranking.window_days, size)
+    return [(ranking, top_users[ranking.name]) for ranking in rankings]
+
+  @metrics.timed
+  def construct_response(self, leaderboards):
+    logger.log("Constructing response...", args=self.vars)
+    response = f"\nResults will update every ~{utils.get_human_readable_time(self.interval)}.\n"
+    if self.num_unexpanded_stubs:
+      response += ("\n*These results are partial: part of the thread hasn't been scanned yet."
+        " It will be included in the next update.*\n")
+    for ranking, users in leaderboards:
+      response += ("\n-----\n"
+        f"\n{ranking.title}\n"
+        f"\n{ranking.summarize(users)}\n")
+    return response
+
+  @metrics.timed
   def print_or_post(self, submission, top_level_comments, response):
-    logger.log("Printing or posting response...", self.vars)
+    logger.log("Printing or posting response...", args=self.vars)
     if self.vars.mode == 'post':
       self.post(submission, top_level_comments, response)
     elif self.vars.mode == 'print':
-      logger.log(f"Printing response: \n{response}", self.vars, True)
-      logger.log(f"Response printed at {time.ctime(time.time())}", self.vars)
+      logger.log(f"Printing response: \n{response}", args=self.vars, condition=True)
+      logger.log(f"Response printed at {time.ctime(time.time())}", args=self.vars)
     else:
       raise ValueError(f"Unexpected mode ({self.vars.mode}). Should be either `post` or `print`.")
 
   def post(self, submission, top_level_comments, response):
-    """Posts the response to Reddit.
+    """Posts the response to Reddit, as decided by plan_post."""
+    if self.leases and not self.leases.holds(logger.get_post_info(self.vars)):
+      # The lease expired during the scan, so another worker may be posting to the thread.
+      logger.log("Lost this post's lease to another worker. Skipping.", args=self.vars, condition=True)
+      return
+    logger.log("Posting response...", args=self.vars)
+    steps = self.plan_post(submission, top_level_comments, response)
+    result = None
+    while True:
+      try:
+        action, target = steps.send(result)
+      except StopIteration:
+        return
+      comment = self.reddit.comment(target) if isinstance(target, str) else target
+      result = None
+      if action == 'edit':
+        try:
+          comment.edit(response)
+        except (PRAWException, PrawcoreException) as e:
+          result = e
+      elif action == 'delete':
+        comment.delete()
+      else:
+        result = target.reply(response)
+
+  def plan_post(self, submission, top_level_comments, response):
+    """Decides how the response is posted, for post (and AsyncTask.post), without making requests.
 
     Behavior depends on comment_mode environment variable:
     - When comment_mode = 'edit'
@@ -216,41 +557,289 @@ class Task:
     - When comment_mode = 'new'
       - If the bot already has a top-level comment, that comment will be deleted.
       - A new comment will be posted.
+
+    The bot remembers the comment it posted and a hash of the response for each submission:
+    - If the response hasn't changed, nothing is posted.
+    - Otherwise, the remembered comment is edited/deleted directly, instead of searching the thread for it.
+
+    This is a generator that yields the (action, target) requests for the caller to make:
+    - ('edit', comment or comment id): the caller sends back the Reddit exception it raised, or None.
+    - ('delete', comment or comment id)
+    - ('reply', submission): the caller sends back the new comment.
     """
-    logger.log("Posting response...", self.vars)
+    response_hash = hashlib.sha256(response.encode()).hexdigest()
+    posted = self.get_posted_response(submission, response_hash)
+    if posted is not None and posted['response_hash'] == response_hash:
+      return
+
+    comment_mode = self.vars.comment_mode
+    if posted is not None and comment_mode == 'edit':
+      error = yield ('edit', posted['comment_id'])
+      if error is None:
+        logger.log(f"Edited previous comment at {time.ctime(time.time())}: {posted['comment_id']}", args=self.vars, condition=True)
+        self.remember_posted_response(submission, posted['comment_id'], response_hash)
+        return
+      # The comment may have been deleted. Fall back to searching the thread.
+      logger.log(f"Unable to edit previous comment {posted['comment_id']} ({error!r})", args=self.vars, condition=True)
+    elif posted is not None and comment_mode == 'new':
+      yield ('delete', posted['comment_id'])
+      logger.log(f"Deleted previous comment at {time.ctime(time.time())}: {posted['comment_id']}", args=self.vars, condition=True)
+      top_level_comments = []
+
     bot_name = self.vars.username
     for comment in top_level_comments:
       if comment.author is None:
         continue
       elif comment.author.name == bot_name:
-        comment_mode = self.vars.comment_mode
         if comment_mode == 'edit':
-          comment.edit(response)
-          logger.log(f"Edited previous comment at {time.ctime(time.time())}: {comment.permalink}", self.vars, True)
+          error = yield ('edit', comment)
+          if error is not None:
+            raise error
+          logger.log(f"Edited previous comment at {time.ctime(time.time())}: {comment.permalink}", args=self.vars, condition=True)
+          self.remember_posted_response(submission, comment.id, response_hash)
           return
         elif comment_mode == 'new':
-          comment.delete()
-          logger.log(f"Deleted previous comment at {time.ctime(time.time())}: {comment.permalink}", self.vars, True)
+          yield ('delete', comment)
+          logger.log(f"Deleted previous comment at {time.ctime(time.time())}: {comment.permalink}", args=self.vars, condition=True)
           continue
         else:
           raise ValueError('Unexpected comment_mode: ' + comment_mode)
-    comment = submission.reply(response)
-    logger.log(f"Posted new comment at {time.ctime(time.time())}: {comment.permalink}", self.vars, True)
+    comment = yield ('reply', submission)
+    logger.log(f"Posted new comment at {time.ctime(time.time())}: {comment.permalink}", args=self.vars, condition=True)
+    self.remember_posted_response(submission, comment.id, response_hash)
+
+  def get_posted_response(self, submission, response_hash):
+    """Returns what the bot remembers posting to the submission, or None. Logs if it matches response_hash."""
+    posted = self.posted_responses.get(submission.id)
+    if posted is not None and posted['response_hash'] == response_hash:
+      logger.log(f"Response hasn't changed since {time.ctime(posted['posted_at'])}. Skipping.", args=self.vars, condition=True)
+    return posted
+
+  def remember_posted_response(self, submission, comment_id, response_hash):
+    self.posted_responses.set(submission.id, {
+      'comment_id': comment_id,
+      'response_hash': response_hash,
+      'posted_at': time.time(),
+    })
+
+def get_task_vars(vars, post):
+  """Makes a copy of the program's vars and sets the target post info for a single task."""
+  # Every var other than posts (which is cleared below) is immutable, so a shallow copy is enough.
+  task_vars = copy.copy(vars)
+  task_vars.post_id = post.post_id
+  task_vars.post_regex = post.post_regex
+  task_vars.subreddit = post.subreddit
+  task_vars.posts = None
+  return task_vars
+
+def report_results(results):
+  """Logs whether each task succeeded and returns the program's exit status.
+
+  results is a list of (task_vars, exception) pairs, where exception is None for tasks that succeeded.
+  """
+  num_failed = 0
+  for task_vars, exception in results:
+    if exception is None:
+      logger.log("Task succeeded", args=task_vars, condition=True)
+    else:
+      num_failed += 1
+      logger.log(f"Task failed: {exception!r}", args=task_vars, condition=True)
+  logger.log(f"{len(results) - num_failed}/{len(results)} tasks succeeded", condition=True)
+  return 1 if num_failed else 0
+
+def run_tasks(tasks, num_workers, timeout=None):
+  """Runs the tasks on a pool of num_workers threads and waits for all of them to finish.
+
+  Returns a list of (task_vars, exception) pairs (see report_results), in the same order as tasks.
+  A task that is still running after timeout seconds is reported as failed. Threads can't be
+  stopped, so its thread is abandoned (as a daemon, so that it doesn't keep the program alive).
+  """
+  def run_task(task):
+    exceptions = []
+    def target():
+      try:
+        task.execute()
+      except Exception as exception:
+        exceptions.append(exception)
+    thread = threading.Thread(target = target, daemon = True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+      error = TimeoutError(f"Task didn't finish within {timeout} seconds")
+      task.record_timeout(error)
+      return error
+    return exceptions[0] if exceptions else None
+  return _run_on_workers(tasks, num_workers, run_task, lambda task: task.vars)
+
+def run_processes(task_vars_list, num_workers, timeout=None, leases=None):
+  """Like run_tasks, but runs each task in its own process, at most num_workers at a time.
+
+  Each process builds its own Reddit client, so tasks don't share a rate limiter or scan state
+  connection. A process that is still running after timeout seconds is terminated. With leases,
+  posts owned by other workers are skipped, and the lease is held (by this process) until the
+  task's process exits. The task's process checks the lease as the same worker before posting.
+  """
+  def run_task(task_vars):
+    label = logger.get_post_info(task_vars)
+    if leases and not leases.claim(label):
+      logger.log("Another worker owns this post. Skipping.", args=task_vars, condition=True)
+      return None
+    try:
+      return run_process(task_vars)
+    finally:
+      if leases:
+        leases.release(label)
+
+  def run_process(task_vars):
+    lease_args = (leases.path, leases.ttl, leases.num_posts, leases.worker_id) if leases else None
+    process = multiprocessing.Process(target = execute_task, args = (task_vars, lease_args))
+    process.start()
+    process.join(timeout)
+    if process.is_alive():
+      process.terminate()
+      process.join()
+      return TimeoutError(f"Task didn't finish within {timeout} seconds")
+    if process.exitcode != 0:
+      return RuntimeError(f"Task process exited with status {process.exitcode}")
+    return None
+  return _run_on_workers(task_vars_list, num_workers, run_task, lambda task_vars: task_vars)
+
+def execute_task(task_vars, lease_args=None):
+  """Entry point of the processes started by run_processes.
+
+  lease_args are the LeaseStore arguments of the parent's worker, or None. This process doesn't
+  start or stop the store: the parent renews and releases its leases.
+  """
+  logger.configure(task_vars.log_format)
+  # run_processes terminates the process after --task_timeout. Raise instead of dying right away, so
+  # that the run's metrics are still written.
+  signal.signal(signal.SIGTERM, _raise_terminated)
+  scan_state = ScanState(task_vars.state_path) if task_vars.state_path else None
+  contribution_store = ContributionStore(task_vars.history_path) if task_vars.history_path else None
+  leases = LeaseStore(*lease_args) if lease_args else None
+  try:
+    Task(task_vars, scan_state, contribution_store=contribution_store, leases=leases).execute()
+  finally:
+    logger.flush()
+
+class TaskTerminated(BaseException):
+  """Raised when run_processes terminates a task's process. Not an Exception, so nothing swallows it."""
+
+def _raise_terminated(signum, frame):
+  raise TaskTerminated("Task process was terminated after --task_timeout")
+
+def _run_on_workers(items, num_workers, run_item, get_vars):
+  """Runs run_item(item) for every item on num_workers threads that pull from a shared queue.
+
+  Returns a list of (task_vars, exception) pairs, in the same order as items.
+  """
+  pending = queue.Queue()
+  for index, item in enumerate(items):
+    pending.put((index, item))
+  results = [None] * len(items)
+
+  def work():
+    while True:
+      try:
+        index, item = pending.get_nowait()
+      except queue.Empty:
+        return
+      results[index] = (get_vars(item), run_item(item))
+
+  workers = [threading.Thread(target = work) for _ in range(max(1, min(num_workers, len(items))))]
+  for worker in workers:
+    worker.start()
+  for worker in workers:
+    worker.join()
+  return results
 
 def main(argv):
   vars = var_utils.load_variables()
-  # Spawn a separate thread to handle each of the target posts in parallel.
+  logger.configure(vars.log_format)
+  if vars.engine == 'asyncio':
+    # Imported here so that asyncpraw is only required by the asyncio engine.
+    import async_task
+    unsupported = [
+      name for name in ('lease_path', 'state_path', 'daemon', 'stream', 'metrics_path', 'skip_unchanged')
+      if getattr(vars, name)]
+    if unsupported:
+      raise ValueError(
+        f"{', '.join('--' + name for name in unsupported)} can't be used with the asyncio engine. Use --engine threads.")
+    task_vars_list = [get_task_vars(vars, post) for post in vars.posts]
+    return report_results(asyncio.run(async_task.run_all(vars, task_vars_list)))
+  elif vars.engine == 'processes':
+    if vars.daemon or vars.stream:
+      raise ValueError("--daemon and --stream aren't supported by the processes engine. Use --engine threads.")
+    elif vars.metrics_path and vars.metrics_format == 'prometheus':
+      # Each process only knows its own post, so every process would overwrite the others' metrics.
+      raise ValueError("--metrics_format prometheus isn't supported by the processes engine. Use json.")
+    num_workers = int(vars.workers)
+    task_vars_list = [get_task_vars(vars, post) for post in vars.posts]
+    for task_vars in task_vars_list:
+      # Processes can't share a rate limiter, so each one gets an equal share of the quota.
+      task_vars.requests_per_minute = max(1, int(vars.requests_per_minute) // min(num_workers, len(task_vars_list)))
+    timeout = float(vars.task_timeout) if vars.task_timeout else None
+    leases = start_leases(vars)
+    try:
+      return report_results(run_processes(task_vars_list, num_workers, timeout, leases))
+    finally:
+      if leases:
+        leases.stop()
+  elif vars.engine != 'threads':
+    raise ValueError(f"Unexpected engine ({vars.engine}). Should be one of `threads`, `processes` or `asyncio`.")
+
+  # Every task shares one authenticated client and one rate limiter.
+  client_pool = ClientPool(vars)
+  # Posts in the same subreddit are resolved from a single listing.
+  resolver = SubmissionResolver(vars)
   for post in vars.posts:
-    # Make a copy of the program's vars for each thread and set the target post info for that thread.
-    task_vars = copy.deepcopy(vars)
-    task_vars.post_id = post.post_id
-    task_vars.post_regex = post.post_regex
-    task_vars.subreddit = post.subreddit
-    task_vars.posts = None
-    task = Task(task_vars)
+    if post.subreddit and post.post_regex:
+      resolver.register(post.subreddit, post.post_regex)
+  posted_responses = FileCache(get_cache_path(vars, 'posts'))
+  fingerprints = FileCache(get_cache_path(vars, 'fingerprints'))
+  contribution_store = ContributionStore(vars.history_path) if vars.history_path else None
+  leases = start_leases(vars)
+  try:
+    return run_tracking(vars, client_pool, resolver, posted_responses, contribution_store, fingerprints, leases)
+  finally:
+    if leases:
+      leases.stop()
+
+def start_leases(vars):
+  """Registers this instance as a worker when --lease_path is set. Returns the LeaseStore, or None."""
+  if not vars.lease_path:
+    return None
+  leases = LeaseStore(vars.lease_path, int(vars.lease_ttl), len(vars.posts))
+  leases.start()
+  logger.log(f"Sharing posts with other workers as {leases.worker_id}.", condition=True)
+  return leases
+
+def run_tracking(vars, client_pool, resolver, posted_responses, contribution_store, fingerprints, leases):
+  """Runs the threaded engine: once, or forever in daemon/stream mode."""
+  if vars.daemon or vars.stream:
+    # Keep scan state between cycles, even if it isn't persisted to disk.
+    scan_state = ScanState(vars.state_path or ':memory:')
+    tasks = [
+      Task(get_task_vars(vars, post), scan_state, client_pool, resolver, posted_responses, contribution_store, fingerprints, leases)
+      for post in vars.posts]
+    if vars.stream:
+      Streamer(tasks, int(vars.interval)).run()
+    else:
+      Scheduler(
+        tasks,
+        int(vars.interval),
+        int(vars.jitter),
+        min_interval = int(vars.min_interval or vars.interval),
+        max_interval = int(vars.max_interval or vars.interval),
+        comments_per_run = float(vars.comments_per_run)).run()
+    return
 
-    threading.Thread(target = task.execute).start()
-  return
+  scan_state = ScanState(vars.state_path) if vars.state_path else None
+  tasks = [
+    Task(get_task_vars(vars, post), scan_state, client_pool, resolver, posted_responses, contribution_store, fingerprints, leases)
+    for post in vars.posts]
+  timeout = float(vars.task_timeout) if vars.task_timeout else None
+  return report_results(run_tasks(tasks, int(vars.workers), timeout))
 
 if __name__ == "__main__":
-  main(sys.argv[1:])
+  sys.exit(main(sys.argv[1:]))
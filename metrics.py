@@ -0,0 +1,149 @@
+import contextlib
+import functools
+import json
+import threading
+import time
+
+"""Per-run instrumentation for Task.
+
+Each run records how long every stage took, how many API requests each stage made (and how long
+they took), how many comments and users it saw, and how much of Reddit's rate limit is left. At the
+end of the run, whether it succeeded or not, the metrics are written to `--metrics_path`, either as
+one JSON object per line or as a Prometheus text file holding the latest run of every post.
+
+Every run ends with a status:
+- `ok`: the response was printed/posted.
+- `unchanged`: skipped because the thread hasn't changed (see --skip_unchanged).
+- `no_users`: the thread has no counted comments.
+- `not_owner`: skipped because another worker owns the post (see leases.py).
+- `failed`: the run raised an exception, which is saved as `error`.
+- `timeout`: the run didn't finish within --task_timeout.
+"""
+
+_lock = threading.Lock()
+# Post label -> metrics of the latest run, used to rewrite Prometheus text files.
+_latest_by_label = dict()
+
+class RunMetrics:
+  def __init__(self, label, client_pool):
+    self.label = label
+    self.client_pool = client_pool
+    self.start_time = time.time()
+    self.stages = dict()
+    self.counts = dict()
+    self.status = 'ok'
+    self.error = None
+
+  @contextlib.contextmanager
+  def stage(self, name):
+    """Times the enclosed stage and counts the API requests it made."""
+    start_requests, _, start_request_seconds = self.client_pool.get_usage(self.label)
+    start_time = time.perf_counter()
+    try:
+      yield
+    finally:
+      num_requests, _, request_seconds = self.client_pool.get_usage(self.label)
+      self.stages[name] = {
+        'seconds': time.perf_counter() - start_time,
+        'api_requests': num_requests - start_requests,
+        'api_request_seconds': request_seconds - start_request_seconds,
+      }
+
+  def count(self, name, value):
+    self.counts[name] = value
+
+  def fail(self, error, status='failed'):
+    self.status = status
+    self.error = repr(error)
+
+  def copy(self):
+    """Returns a copy that the run can't change anymore, e.g. to report a run that is still going."""
+    copied = RunMetrics(self.label, self.client_pool)
+    copied.start_time = self.start_time
+    copied.stages = dict(self.stages)
+    copied.counts = dict(self.counts)
+    copied.status = self.status
+    copied.error = self.error
+    return copied
+
+  def to_dict(self, reddit=None):
+    num_requests = sum(stage['api_requests'] for stage in self.stages.values())
+    request_seconds = sum(stage['api_request_seconds'] for stage in self.stages.values())
+    return {
+      'post': self.label,
+      'status': self.status,
+      'error': self.error,
+      'start_time': self.start_time,
+      'seconds': time.time() - self.start_time,
+      'api_requests': num_requests,
+      'api_request_mean_seconds': request_seconds / num_requests if num_requests else 0,
+      'rate_limit': get_rate_limit(reddit),
+      'counts': self.counts,
+      'stages': self.stages,
+    }
+
+  def emit(self, path, format='json', reddit=None):
+    """Writes the run's metrics to path. Does nothing if path is not set."""
+    if not path:
+      return
+    metrics = self.to_dict(reddit)
+    with _lock:
+      if format == 'prometheus':
+        _latest_by_label[self.label] = metrics
+        with open(path, 'w') as file:
+          file.write(to_prometheus(_latest_by_label.values()))
+      elif format == 'json':
+        with open(path, 'a') as file:
+          file.write(json.dumps(metrics) + '\n')
+      else:
+        raise ValueError(f"Unexpected metrics_format ({format}). Should be either `json` or `prometheus`.")
+
+def timed(method):
+  """Decorates a Task method so that each call is recorded as a stage in the task's RunMetrics."""
+  @functools.wraps(method)
+  def wrapper(self, *args, **kwargs):
+    with self.metrics.stage(method.__name__):
+      return method(self, *args, **kwargs)
+  return wrapper
+
+def get_rate_limit(reddit):
+  """Returns the rate limit headroom Reddit reported in its latest response, if any."""
+  limits = getattr(getattr(reddit, 'auth', None), 'limits', None) or dict()
+  return {
+    'remaining': limits.get('remaining'),
+    'used': limits.get('used'),
+    'reset_timestamp': limits.get('reset_timestamp'),
+  }
+
+def to_prometheus(metrics_list):
+  """Renders metrics as a Prometheus text file, with the samples of each metric grouped together."""
+  samples = {
+    'reddit_tracker_run_status': [],
+    'reddit_tracker_run_seconds': [],
+    'reddit_tracker_api_requests': [],
+    'reddit_tracker_rate_limit_remaining': [],
+    'reddit_tracker_count': [],
+    'reddit_tracker_stage_seconds': [],
+    'reddit_tracker_stage_api_requests': [],
+  }
+  for metrics in metrics_list:
+    post = _escape_label(metrics['post'])
+    samples['reddit_tracker_run_status'].append((f'post="{post}",status="{metrics["status"]}"', 1))
+    samples['reddit_tracker_run_seconds'].append((f'post="{post}"', metrics['seconds']))
+    samples['reddit_tracker_api_requests'].append((f'post="{post}"', metrics['api_requests']))
+    if metrics['rate_limit']['remaining'] is not None:
+      samples['reddit_tracker_rate_limit_remaining'].append((f'post="{post}"', metrics['rate_limit']['remaining']))
+    for name, value in metrics['counts'].items():
+      samples['reddit_tracker_count'].append((f'post="{post}",name="{name}"', value))
+    for name, stage in metrics['stages'].items():
+      samples['reddit_tracker_stage_seconds'].append((f'post="{post}",stage="{name}"', stage['seconds']))
+      samples['reddit_tracker_stage_api_requests'].append((f'post="{post}",stage="{name}"', stage['api_requests']))
+
+  lines = []
+  for metric, metric_samples in samples.items():
+    lines.append(f"# TYPE {metric} gauge")
+    lines.extend(f"{metric}{{{labels}}} {value}" for labels, value in metric_samples)
+  return '\n'.join(lines) + '\n'
+
+def _escape_label(value):
+  return value.replace('\\', '\\\\').replace('"', '\\"')
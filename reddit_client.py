@@ -0,0 +1,167 @@
+import collections
+import contextlib
+import threading
+import time
+
+import praw
+import prawcore
+import requests
+
+from file_cache import FileCache, get_cache_path
+
+"""Process-wide Reddit client shared by every task.
+
+All tasks share one authenticated praw.Reddit instance, so the bot only fetches one OAuth token and
+reuses one pool of HTTP connections. Every request goes through a single TokenBucket, which keeps the
+bot under its account's quota and hands out requests in arrival order so that no task starves the
+others. Requests are attributed to whichever task made them (see ClientPool.track).
+
+If `cache_dir` is set, the OAuth access token is also saved to disk and reused by later runs until
+it expires, so short-lived runs don't each start with a token exchange.
+"""
+
+# Saved tokens that expire within this many seconds are not reused.
+TOKEN_EXPIRY_MARGIN = 60
+
+class TokenBucket:
+  """Thread-safe token bucket that allows `rate` requests per second, with bursts of up to `capacity`."""
+  def __init__(self, rate, capacity):
+    self.rate = rate
+    self.capacity = capacity
+    self._tokens = capacity
+    self._updated_at = time.monotonic()
+    self._lock = threading.Lock()
+
+  def acquire(self):
+    """Blocks until a request may be made. Returns the number of seconds spent waiting."""
+    with self._lock:
+      now = time.monotonic()
+      self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+      self._updated_at = now
+      # Reserve a token, even if it hasn't been refilled yet. Later callers queue up behind this one.
+      self._tokens -= 1
+      wait = 0 if self._tokens >= 0 else -self._tokens / self.rate
+    if wait > 0:
+      time.sleep(wait)
+    return wait
+
+class RateLimitedRequestor(prawcore.Requestor):
+  """prawcore Requestor that takes a token from the pool's bucket before every HTTP request."""
+  def __init__(self, *args, pool, **kwargs):
+    super().__init__(*args, **kwargs)
+    self._pool = pool
+
+  def request(self, *args, **kwargs):
+    waited = self._pool.bucket.acquire()
+    start_time = time.monotonic()
+    try:
+      return super().request(*args, **kwargs)
+    finally:
+      self._pool.record(waited, time.monotonic() - start_time)
+
+class ClientPool:
+  """Owns the shared praw.Reddit instance and tracks how much of the request budget each task uses."""
+  def __init__(self, vars):
+    self.vars = vars
+    requests_per_minute = int(vars.requests_per_minute)
+    self.bucket = TokenBucket(
+      rate=requests_per_minute / 60,
+      capacity=max(1, int(vars.request_burst)))
+    self._reddit = None
+    self._lock = threading.Lock()
+    self._local = threading.local()
+    # Task label -> [num_requests, seconds waiting for the bucket, seconds spent in requests]
+    self._usage = collections.defaultdict(lambda: [0, 0.0, 0.0])
+    # The token is a credential, so only the bot's user may read it.
+    token_path = get_cache_path(vars, 'token')
+    self._tokens = FileCache(token_path, mode=0o600) if token_path else None
+    self._token_key = f"{vars.client_id}:{vars.username}"
+    self._saved_token = None
+
+  def get(self):
+    """Returns the shared praw.Reddit instance, creating it on first use."""
+    with self._lock:
+      if self._reddit is None:
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_maxsize=max(10, len(self.vars.posts or [])))
+        session.mount('https://', adapter)
+        self._reddit = praw.Reddit(
+          user_agent=self.vars.user_agent,
+          client_id=self.vars.client_id,
+          client_secret=self.vars.client_secret,
+          username=self.vars.username,
+          password=self.vars.password,
+          validate_on_submit=True,
+          requestor_class=RateLimitedRequestor,
+          requestor_kwargs={'session': session, 'pool': self})
+        self._restore_token()
+      return self._reddit
+
+  @contextlib.contextmanager
+  def track(self, label):
+    """Attributes requests made by the current thread to `label` while the context is active."""
+    previous_label = getattr(self._local, 'label', None)
+    self._local.label = label
+    try:
+      yield
+    finally:
+      self._local.label = previous_label
+
+  def record(self, waited, elapsed):
+    label = getattr(self._local, 'label', None) or 'untracked'
+    with self._lock:
+      usage = self._usage[label]
+      usage[0] += 1
+      usage[1] += waited
+      usage[2] += elapsed
+    self._save_token()
+
+  def get_usage(self, label):
+    """Returns (num_requests, seconds waiting for the rate limiter, seconds spent in requests) for `label`."""
+    with self._lock:
+      return tuple(self._usage.get(label, [0, 0.0, 0.0]))
+
+  def usage_summary(self, label):
+    """Returns a human-readable summary of the requests made on behalf of `label`."""
+    num_requests, waited, elapsed = self.get_usage(label)
+    with self._lock:
+      total_requests = sum(usage[0] for usage in self._usage.values())
+    share = 100 * num_requests / total_requests if total_requests else 0
+    return (f"{num_requests} API requests ({share:.0f}% of the shared budget used so far), "
+      f"{elapsed:.1f}s in requests, {waited:.1f}s waiting for the rate limiter")
+
+  def _get_authorizer(self):
+    """Returns the prawcore authorizer of the shared client, if it holds a token that can be cached."""
+    core = getattr(self._reddit, '_authorized_core', None)
+    authorizer = getattr(core, '_authorizer', None)
+    # Expiration timestamps are private to prawcore. Older versions track them in wall-clock seconds
+    # (_expiration_timestamp) instead of monotonic nanoseconds, so their tokens aren't cached.
+    if authorizer is None or hasattr(authorizer, '_expiration_timestamp'):
+      return None
+    return authorizer
+
+  def _restore_token(self):
+    """Hands the token saved by a previous run to the new client, if it is still valid.
+
+    If Reddit rejects it anyway, prawcore clears it and fetches a new one.
+    """
+    authorizer = self._get_authorizer() if self._tokens else None
+    token = self._tokens.get(self._token_key) if authorizer else None
+    if token is None or token['expires_at'] - time.time() < TOKEN_EXPIRY_MARGIN:
+      return
+    authorizer.access_token = token['access_token']
+    authorizer.scopes = set(token['scopes'])
+    authorizer._expiration_timestamp_ns = time.monotonic_ns() + int((token['expires_at'] - time.time()) * 1e9)
+    self._saved_token = token['access_token']
+
+  def _save_token(self):
+    """Saves the client's token when it has changed (i.e. after a token exchange)."""
+    authorizer = self._get_authorizer() if self._tokens else None
+    if authorizer is None or authorizer.access_token is None or authorizer.access_token == self._saved_token:
+      return
+    self._saved_token = authorizer.access_token
+    self._tokens.set(self._token_key, {
+      'access_token': authorizer.access_token,
+      'scopes': sorted(authorizer.scopes or []),
+      'expires_at': time.time() + (authorizer._expiration_timestamp_ns - time.monotonic_ns()) / 1e9,
+    })
@@ -0,0 +1,132 @@
+import sqlite3
+import threading
+
+from user import Contribution, User
+
+"""Checkpoint store that lets repeated scans of a thread only process new comments.
+
+Every comment the bot has seen in a submission is saved as a Contribution, tagged with the role it
+played in the previous scans:
+- `question`: a counted top-level comment.
+- `reply`: a counted reply to a question.
+- `bot`: a top-level comment made by the bot, itself.
+- `ignored`: anything else (deleted comments, filtered users, nested replies, etc).
+
+Per-user counts and per-question reply counts are rebuilt from these records when a submission is
+loaded, then kept up to date in memory as new comments are folded in.
+"""
+
+QUESTION = 'question'
+REPLY = 'reply'
+BOT = 'bot'
+IGNORED = 'ignored'
+
+class SubmissionState:
+  """Everything a previous scan learned about a single submission."""
+  def __init__(self, submission_id):
+    self.submission_id = submission_id
+    self.seen_comment_ids = set()
+    self.questions = {}
+    self.replies = {}
+    self.bot_comment_ids = []
+    # "Load more" stub id -> when the stub was last expanded (see Task.get_new_comments). Not persisted.
+    self.stub_expansion_times = {}
+    # (kind, Contribution) pairs added since the state was last saved.
+    self.pending = []
+
+  def add(self, kind, contribution):
+    """Folds a newly seen comment into the state."""
+    self._index(kind, contribution)
+    self.pending.append((kind, contribution))
+
+  def _index(self, kind, contribution):
+    self.seen_comment_ids.add(contribution.id)
+    if kind == QUESTION:
+      self.questions[contribution.id] = contribution
+    elif kind == REPLY:
+      self.replies[contribution.id] = contribution
+      self.questions[contribution.parent_id[3:]].num_replies += 1
+    elif kind == BOT:
+      self.bot_comment_ids.append(contribution.id)
+
+  def is_question(self, fullname):
+    """Returns whether the comment with the given fullname (e.g. `t1_abc`) is a counted question."""
+    return fullname[3:] in self.questions
+
+  def to_users(self):
+    """Returns a dictionary mapping(name -> User) built from the counted questions and replies."""
+    users_by_name = dict()
+    for question in self.questions.values():
+      user = users_by_name.get(question.author, User(name=question.author))
+      user.add_question(question)
+      users_by_name[question.author] = user
+    for reply in self.replies.values():
+      requestor = users_by_name.get(self.questions[reply.parent_id[3:]].author)
+      requestor.inc_num_replies_to_questions()
+      replier = users_by_name.get(reply.author, User(name=reply.author))
+      replier.add_reply(reply)
+      users_by_name[reply.author] = replier
+    return users_by_name
+
+class ScanState:
+  """SQLite-backed store of SubmissionStates, keyed by submission id."""
+  def __init__(self, path):
+    self.path = path
+    self._lock = threading.Lock()
+    # A single connection is shared by every task (guarded by _lock), so that an in-memory database
+    # (path=':memory:') lives as long as this object.
+    self._connection = sqlite3.connect(path, check_same_thread=False)
+    # States that have already been loaded are kept in memory and reused by later runs, until evicted.
+    self._states = dict()
+    with self._connection as connection:
+      connection.execute(
+        """CREATE TABLE IF NOT EXISTS comments (
+          submission_id TEXT NOT NULL,
+          comment_id TEXT NOT NULL,
+          kind TEXT NOT NULL,
+          author TEXT,
+          parent_id TEXT,
+          permalink TEXT,
+          created_utc REAL,
+          PRIMARY KEY (submission_id, comment_id))""")
+      # Files written before created_utc was tracked lack the column. Their existing rows keep NULL.
+      columns = {row[1] for row in connection.execute("PRAGMA table_info(comments)")}
+      if 'created_utc' not in columns:
+        connection.execute("ALTER TABLE comments ADD COLUMN created_utc REAL")
+
+  def load(self, submission_id):
+    """Returns the SubmissionState saved for the given submission (empty if it was never scanned)."""
+    if submission_id in self._states:
+      return self._states[submission_id]
+    state = SubmissionState(submission_id)
+    with self._lock, self._connection as connection:
+      rows = connection.execute(
+        "SELECT kind, comment_id, permalink, parent_id, author, created_utc FROM comments WHERE submission_id = ? ORDER BY rowid",
+        (submission_id,))
+      for kind, comment_id, permalink, parent_id, author, created_utc in rows:
+        state._index(kind, Contribution(comment_id, permalink, parent_id, author, created_utc=created_utc))
+    self._states[submission_id] = state
+    return state
+
+  def evict(self, submission_id):
+    """Drops the submission's state from memory, e.g. once a newer daily thread replaced it.
+
+    Unsaved records are saved first. An in-memory database only lives as long as this object, so its
+    rows for the submission are deleted as well.
+    """
+    state = self._states.pop(submission_id, None)
+    if state is not None and state.pending:
+      self.save(state)
+    if self.path == ':memory:':
+      with self._lock, self._connection as connection:
+        connection.execute("DELETE FROM comments WHERE submission_id = ?", (submission_id,))
+
+  def save(self, state):
+    """Persists the records that were added to the SubmissionState since it was loaded or last saved."""
+    with self._lock, self._connection as connection:
+      connection.executemany(
+        "INSERT OR IGNORE INTO comments VALUES (?, ?, ?, ?, ?, ?, ?)",
+        [(state.submission_id, contribution.id, kind, contribution.author, contribution.parent_id, contribution.permalink,
+          contribution.created_utc)
+          for kind, contribution in state.pending])
+    state.pending = []
@@ -0,0 +1,99 @@
+import heapq
+import random
+import threading
+import time
+
+import logger
+
+"""Runs tasks on their own timers inside a single long-running process.
+
+Used by `main.py --daemon`. The Reddit client and in-memory scan state are reused between runs, so a
+cycle only pays for the API calls it actually needs.
+
+Each task's interval adapts to how active its thread is. After every run, the scheduler measures how
+many comments arrived per second since the task's previous run (a moving average, so a single burst
+doesn't swing it too far) and picks the interval at which about `comments_per_run` new comments are
+expected, bounded by `min_interval` and `max_interval`. Busy threads are scanned often, while idle
+ones back off. With the default bounds (both equal to `interval`), every task keeps a fixed interval.
+"""
+
+# Weight of the latest measurement in the moving average of each thread's comment rate.
+RATE_SMOOTHING = 0.5
+
+class Scheduler:
+  def __init__(self, tasks, interval, jitter=0, min_interval=None, max_interval=None, comments_per_run=20):
+    self.tasks = tasks
+    self.interval = interval
+    self.jitter = jitter
+    self.min_interval = min_interval or interval
+    self.max_interval = max_interval or interval
+    self.comments_per_run = comments_per_run
+    self._threads = dict()
+    # Task index -> (time, num_comments) that its comment rate was last measured from.
+    self._comment_counts = dict()
+    # Task index -> moving average of the comments per second that arrive in its thread.
+    self._rates = dict()
+
+  def run(self):
+    """Runs every task once per (adaptive) interval, forever.
+
+    - Each run is delayed by a random amount of up to `jitter` seconds, so tasks don't all hit Reddit
+      at the same moment.
+    - If a task's previous run is still going when it is due again, that cycle is skipped instead of
+      starting an overlapping run.
+    """
+    # Heap of (due_time, scheduled_time, task_index). Jitter is applied to the due time only, so it
+    # doesn't accumulate from one cycle to the next.
+    queue = [(self._with_jitter(time.time()), time.time(), i) for i in range(len(self.tasks))]
+    heapq.heapify(queue)
+    while queue:
+      due_time, scheduled_time, index = heapq.heappop(queue)
+      time.sleep(max(0, due_time - time.time()))
+      interval = self._get_interval(index)
+      # Shown in the task's response.
+      self.tasks[index].interval = interval
+      self._start(index)
+      # Never schedule a run in the past, e.g. after the machine was suspended.
+      scheduled_time = max(scheduled_time + interval, time.time())
+      heapq.heappush(queue, (self._with_jitter(scheduled_time), scheduled_time, index))
+
+  def _get_interval(self, index):
+    """Returns the interval until the task's next run, based on its thread's recent activity."""
+    comment_count = self.tasks[index].comment_count
+    previous_comment_count = self._comment_counts.get(index)
+    if comment_count is not None and previous_comment_count is not None and comment_count[0] > previous_comment_count[0]:
+      # Deleted comments can make the count go down. That isn't activity.
+      rate = max(0, comment_count[1] - previous_comment_count[1]) / (comment_count[0] - previous_comment_count[0])
+      previous_rate = self._rates.get(index, rate)
+      self._rates[index] = RATE_SMOOTHING * rate + (1 - RATE_SMOOTHING) * previous_rate
+    if comment_count is not None:
+      self._comment_counts[index] = comment_count
+
+    rate = self._rates.get(index)
+    if rate is None:
+      interval = self.interval
+    elif rate == 0:
+      interval = self.max_interval
+    else:
+      interval = self.comments_per_run / rate
+    return int(min(self.max_interval, max(self.min_interval, interval)))
+
+  def _with_jitter(self, scheduled_time):
+    return scheduled_time + random.uniform(0, self.jitter)
+
+  def _start(self, index):
+    task = self.tasks[index]
+    thread = self._threads.get(index)
+    if thread is not None and thread.is_alive():
+      logger.log("Previous run is still in progress. Skipping this cycle.", args=task.vars, condition=True)
+      return
+    thread = threading.Thread(target=self._execute, args=(task,), daemon=True)
+    self._threads[index] = thread
+    thread.start()
+
+  def _execute(self, task):
+    # Keep the daemon alive if a single run fails. It will be retried on the next cycle.
+    try:
+      task.execute()
+    except Exception as e:
+      logger.log(f"Task failed: {e!r}", args=task.vars, condition=True)
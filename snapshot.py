@@ -0,0 +1,206 @@
+import argparse
+import array
+import collections
+import heapq
+import itertools
+import json
+import mmap
+import os
+import struct
+import sys
+
+"""Compact columnar snapshots of the question/reply graph built by a run.
+
+A snapshot holds one row per counted question or reply, stored column by column:
+- `comment_id`, `parent_id`: base 36 comment/submission ids decoded to integers (int64).
+- `author`: index into the snapshot's list of authors (int32).
+- `created_utc`: the comment's creation time (float64), or 0 if unknown.
+- `kind`: QUESTION or REPLY (uint8).
+
+The file starts with MAGIC, the length of a JSON header and the header itself, which lists the
+authors and where each column starts. Columns are aligned to 8 bytes, so Snapshot can memory-map a
+file and read its columns in place. The authors are listed in the order the run encountered them,
+so ties in compute_rankings are broken the same way as in leaderboard.py.
+
+Snapshots can also be ranked from the command line, e.g. across every thread of a month:
+
+  $ python3 snapshot.py snapshots/*.snapshot --reply_threshold 3
+"""
+
+MAGIC = b'RCTSNAP1'
+QUESTION = 0
+REPLY = 1
+# (name, array typecode) of every column, in the order they are written.
+COLUMNS = (
+  ('comment_id', 'q'),
+  ('parent_id', 'q'),
+  ('author', 'i'),
+  ('created_utc', 'd'),
+  ('kind', 'B'),
+)
+# bytes.translate tables that turn the kind column into masks for itertools.compress.
+_QUESTION_MASK = bytes(int(kind == QUESTION) for kind in range(256))
+_REPLY_MASK = bytes(int(kind == REPLY) for kind in range(256))
+
+def write(path, submission_id, users_by_name):
+  """Writes a snapshot of the questions and replies in users_by_name to path, replacing any existing file."""
+  author_indices = {name: index for index, name in enumerate(users_by_name)}
+  columns = {name: array.array(typecode) for name, typecode in COLUMNS}
+  for user in users_by_name.values():
+    for kind, contributions in ((QUESTION, user.questions), (REPLY, user.replies)):
+      for contribution in contributions:
+        columns['comment_id'].append(int(contribution.id, 36))
+        columns['parent_id'].append(int(contribution.parent_id[3:], 36))
+        columns['author'].append(author_indices[user.name])
+        columns['created_utc'].append(contribution.created_utc or 0)
+        columns['kind'].append(kind)
+
+  # Column offsets relative to the (8-byte aligned) end of the header.
+  relative_offsets = []
+  size = 0
+  for name, _ in COLUMNS:
+    relative_offsets.append(size)
+    size += _align(len(columns[name]) * columns[name].itemsize)
+  header = {
+    'submission_id': submission_id,
+    'num_rows': len(columns['kind']),
+    'byteorder': sys.byteorder,
+    'authors': list(users_by_name),
+  }
+  # The header's length depends on the column offsets it lists, so grow the space reserved for it
+  # until it fits.
+  data_offset = 0
+  while True:
+    header['offsets'] = [data_offset + offset for offset in relative_offsets]
+    encoded_header = json.dumps(header).encode()
+    header_end = _align(len(MAGIC) + 4 + len(encoded_header))
+    if header_end <= data_offset:
+      break
+    data_offset = header_end
+  encoded_header = encoded_header.ljust(data_offset - len(MAGIC) - 4)
+
+  os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+  # Write to a temporary file first, so that readers never map a half-written snapshot.
+  temporary_path = f"{path}.{os.getpid()}.tmp"
+  with open(temporary_path, 'wb') as file:
+    file.write(MAGIC + struct.pack('<I', len(encoded_header)) + encoded_header)
+    for name, _ in COLUMNS:
+      data = columns[name].tobytes()
+      file.write(data + b'\0' * (_align(len(data)) - len(data)))
+  os.replace(temporary_path, path)
+
+class Snapshot:
+  """Read-only, memory-mapped snapshot. `columns` maps each column name to a typed memoryview."""
+  def __init__(self, path):
+    self.path = path
+    with open(path, 'rb') as file:
+      self._mmap = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    if self._mmap[:len(MAGIC)] != MAGIC:
+      self._mmap.close()
+      raise ValueError(f"{path} is not a snapshot.")
+    header_length, = struct.unpack_from('<I', self._mmap, len(MAGIC))
+    header_start = len(MAGIC) + 4
+    header = json.loads(self._mmap[header_start:header_start + header_length])
+    if header['byteorder'] != sys.byteorder:
+      self._mmap.close()
+      raise ValueError(f"{path} was written on a {header['byteorder']}-endian machine.")
+    self.submission_id = header['submission_id']
+    self.num_rows = header['num_rows']
+    self.authors = header['authors']
+    self._view = memoryview(self._mmap)
+    self.columns = dict()
+    for (name, typecode), offset in zip(COLUMNS, header['offsets']):
+      length = self.num_rows * array.array(typecode).itemsize
+      self.columns[name] = self._view[offset:offset + length].cast(typecode)
+
+  def close(self):
+    for column in self.columns.values():
+      column.release()
+    self._view.release()
+    self._mmap.close()
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    self.close()
+
+def compute_rankings(snapshots, reply_threshold, k=10):
+  """Computes the rankings of leaderboard.py from one or more snapshots, aggregated by author.
+
+  Returns a dict mapping(ranking name -> list of its top k (author, score) pairs, best first). Counts
+  are computed with C-level passes over the columns (bytes.translate, itertools.compress and
+  collections.Counter), so no per-comment Python objects are built.
+  """
+  # Author -> position of their first appearance, used to break ties.
+  order = dict()
+  num_replies = collections.Counter()
+  num_questions = collections.Counter()
+  num_replies_received = collections.Counter()
+  under_answered_authors = set()
+  for snapshot in snapshots:
+    authors = snapshot.authors
+    for author in authors:
+      order.setdefault(author, len(order))
+    columns = snapshot.columns
+    kinds = columns['kind'].tobytes()
+    reply_mask = kinds.translate(_REPLY_MASK)
+    question_mask = kinds.translate(_QUESTION_MASK)
+
+    for index, count in collections.Counter(itertools.compress(columns['author'], reply_mask)).items():
+      num_replies[authors[index]] += count
+    replies_by_question = collections.Counter(itertools.compress(columns['parent_id'], reply_mask))
+    for question_id, index in zip(
+        itertools.compress(columns['comment_id'], question_mask),
+        itertools.compress(columns['author'], question_mask)):
+      author = authors[index]
+      count = replies_by_question.get(question_id, 0)
+      num_questions[author] += 1
+      num_replies_received[author] += count
+      if count < reply_threshold:
+        under_answered_authors.add(author)
+
+  helpers = [author for author in order if num_replies[author] > 0]
+  def top(authors, score):
+    ranked = heapq.nsmallest(k, authors, key=lambda author: (-score(author), order[author]))
+    return [(author, score(author)) for author in ranked]
+  return {
+    'most_helpful': top(helpers, lambda author: num_replies[author]),
+    'under_answered_helpers': top(
+      [author for author in helpers if author in under_answered_authors],
+      lambda author: num_replies[author]),
+    'relative_contribution': top(
+      helpers,
+      lambda author: num_replies[author] - num_replies_received[author] - num_questions[author]),
+  }
+
+def _align(size):
+  return (size + 7) // 8 * 8
+
+def main(argv):
+  parser = argparse.ArgumentParser()
+  parser.add_argument(
+    "paths",
+    nargs = '+',
+    help = "Snapshots to rank together.")
+  parser.add_argument(
+    "--reply_threshold",
+    default = 3,
+    type = int,
+    help = "The minimum number of replies to a question before it stops counting as under-answered.")
+  parser.add_argument(
+    "--leaderboard_size",
+    default = 10,
+    type = int,
+    help = "The maximum number of users listed in each ranking.")
+  args = parser.parse_args(argv)
+
+  snapshots = [Snapshot(path) for path in args.paths]
+  try:
+    print(json.dumps(compute_rankings(snapshots, args.reply_threshold, args.leaderboard_size), indent=2))
+  finally:
+    for snapshot in snapshots:
+      snapshot.close()
+
+if __name__ == "__main__":
+  main(sys.argv[1:])
@@ -0,0 +1,173 @@
+import time
+
+import logger
+import metrics
+
+from prawcore import PrawcoreException
+
+"""Keeps scan state up to date from the live comment stream of the tracked posts' subreddits.
+
+Used by `main.py --stream`. Each tracked post is scanned once (incrementally, see
+Task.scan_new_comments) to catch up, after which every comment posted to its subreddit is routed to
+the post it belongs to and folded into the post's scan state as it arrives. Every `interval`
+seconds, the posts that received new comments are re-ranked and their responses printed/posted, so
+the cost of a cycle depends on the thread's new activity instead of its size.
+
+The stream only returns the subreddit's latest comments, so it can miss some: while it reconnects
+after an outage, or when many comments land between the catch-up scan and its first poll. Whenever
+the stream is (re)started, every tracked post is therefore scanned again (incrementally) once the
+stream has consumed its backlog. Streamed replies whose parent isn't in the post's scan state yet
+are left for that scan, so that they are counted once their question is found.
+"""
+
+# Seconds to wait before reconnecting after the stream fails.
+RECONNECT_DELAY = 30
+
+class Streamer:
+  def __init__(self, tasks, interval):
+    self.tasks = tasks
+    for task in tasks:
+      # Catching up has to load every post's scan state, even if the post hasn't changed.
+      task.vars.skip_unchanged = False
+    self.interval = interval
+    # Submission id -> (task, submission) for every tracked post.
+    self._tracked = dict()
+    # Submission ids with comments that haven't been included in a response yet.
+    self._dirty = set()
+
+  def run(self):
+    """Consumes the comment stream forever, responding every interval seconds."""
+    while True:
+      self._track_submissions()
+      if not self._tracked:
+        logger.log(f"No posts to track. Retrying in {self.interval} seconds.", condition=True)
+        time.sleep(self.interval)
+        continue
+      subreddits = sorted({self._get_subreddit(task, submission) for task, submission in self._tracked.values()})
+      # Every task shares the same client.
+      reddit = self.tasks[0].client_pool.get()
+      # pause_after=0 makes the stream yield None whenever a poll finds nothing new, so that
+      # responses are still sent on time when the subreddit is quiet.
+      stream = reddit.subreddit('+'.join(subreddits)).stream.comments(pause_after=0)
+      next_response_time = time.time() + self.interval
+      rescan_pending = True
+      try:
+        for comment in stream:
+          if comment is not None:
+            self._route(comment)
+          if time.time() >= next_response_time:
+            if rescan_pending:
+              # By now the stream's first poll has returned, so the scan covers whatever it missed.
+              self._rescan()
+              rescan_pending = False
+            self._respond()
+            next_response_time = max(next_response_time + self.interval, time.time())
+            # Daily threads get replaced, so check whether any of the targets changed.
+            if self._track_submissions():
+              break
+      except PrawcoreException as e:
+        logger.log(f"Comment stream failed: {e!r}. Reconnecting in {RECONNECT_DELAY} seconds.", condition=True)
+        time.sleep(RECONNECT_DELAY)
+
+  def _track_submissions(self):
+    """Resolves every task's target, catching up on posts that weren't tracked yet.
+
+    Returns whether the set of tracked posts changed.
+    """
+    tracked = dict()
+    for task in self.tasks:
+      if task.leases and not task.leases.claim(logger.get_post_info(task.vars)):
+        # Another worker owns the post, so its comments are left to that worker.
+        continue
+      submission = self._run(task, task.get_submission)
+      if submission is None:
+        continue
+      elif submission.id in self._tracked:
+        tracked[submission.id] = self._tracked[submission.id]
+        continue
+      logger.log(f"Tracking submission: {submission.id}", args=task.vars, condition=True)
+      # Catch up with the comments posted before the stream started.
+      if self._run(task, self._catch_up, task):
+        tracked[submission.id] = (task, submission)
+    changed = tracked.keys() != self._tracked.keys()
+    self._tracked = tracked
+    return changed
+
+  def _route(self, comment):
+    """Folds a streamed comment into the scan state of the post it belongs to, if it's tracked."""
+    submission_id = comment.link_id[3:]
+    if submission_id not in self._tracked:
+      return
+    task, submission = self._tracked[submission_id]
+    state = task.scan_state.load(submission_id)
+    if comment.id in state.seen_comment_ids:
+      return
+    elif comment.parent_id != submission.fullname and comment.parent_id[3:] not in state.seen_comment_ids:
+      # The stream missed the parent. Recording the reply now would mark it as ignored for good.
+      return
+    task.fold_comments(state, submission.fullname, [comment])
+    self._dirty.add(submission_id)
+
+  def _respond(self):
+    """Saves the new comments of every post that received some, then re-ranks and posts/prints it."""
+    for submission_id in sorted(self._dirty):
+      task, submission = self._tracked[submission_id]
+      self._run(task, self._respond_to, task, submission)
+    self._dirty = set()
+
+  def _rescan(self):
+    """Scans every tracked post for comments that the stream missed."""
+    for submission_id, (task, _) in self._tracked.items():
+      if self._run(task, self._rescan_post, task, submission_id):
+        self._dirty.add(submission_id)
+
+  def _rescan_post(self, task, submission_id):
+    """Folds the post's missed comments into its scan state. Returns whether there were any."""
+    # A fresh submission, since an already fetched one doesn't fetch its comments again.
+    submission = task.get_submission()
+    if submission.id != submission_id:
+      # The target was replaced. _track_submissions will catch up on the new one.
+      return False
+    state = task.scan_state.load(submission_id)
+    num_seen_comments = len(state.seen_comment_ids)
+    task.scan_new_comments(submission)
+    return len(state.seen_comment_ids) > num_seen_comments
+
+  def _catch_up(self, task):
+    task.execute()
+    return True
+
+  def _respond_to(self, task, submission):
+    task.metrics = metrics.RunMetrics(task.metrics.label, task.client_pool)
+    try:
+      state = task.scan_state.load(submission.id)
+      task.scan_state.save(state)
+      users_by_name = state.to_users()
+      if not users_by_name:
+        task.metrics.status = 'no_users'
+        return
+      if task.contribution_store:
+        task.save_contributions(submission, users_by_name)
+      if task.vars.snapshot_dir:
+        task.write_snapshot(submission, users_by_name)
+      bot_comments = [task.reddit.comment(comment_id) for comment_id in state.bot_comment_ids]
+      task.respond(submission, bot_comments, users_by_name)
+      logger.log(f"Responded to streamed comments. {task.client_pool.usage_summary(task.metrics.label)}", args=task.vars, condition=True)
+    except BaseException as e:
+      task.metrics.fail(e)
+      raise
+    finally:
+      task.metrics.emit(task.vars.metrics_path, task.vars.metrics_format, task.reddit)
+
+  def _run(self, task, function, *args):
+    """Runs function on behalf of task. Returns its result, or None if it failed."""
+    try:
+      with task.client_pool.track(logger.get_post_info(task.vars)):
+        return function(*args)
+    except Exception as e:
+      # Keep streaming if a single post fails. It will be retried on the next cycle.
+      logger.log(f"Task failed: {e!r}", args=task.vars, condition=True)
+      return None
+
+  def _get_subreddit(self, task, submission):
+    return task.vars.subreddit or submission.subreddit.display_name
@@ -0,0 +1,90 @@
+import collections
+import re
+import threading
+import time
+
+import logger
+
+from file_cache import FileCache, get_cache_path
+
+"""Cache that resolves (subreddit, post_regex) targets to submission ids.
+
+Resolving a target means listing the subreddit's hot posts and matching their titles, which costs an
+API call. Daily threads keep the same id for their whole life, so a resolved id is reused until
+either `resolution_ttl` seconds have passed or the thread has grown older than `thread_lifetime`
+seconds since it was resolved (at which point a newer thread has probably replaced it). A thread
+that was already older than that when the listing matched it is still used, like any other match.
+When a listing is needed, it is fetched once per subreddit and matched against every target
+registered for that subreddit.
+
+If `cache_dir` is set, resolved ids are saved to disk so that they also survive between runs.
+"""
+
+class SubmissionResolver:
+  def __init__(self, vars):
+    self.ttl = int(vars.resolution_ttl)
+    self.thread_lifetime = int(vars.thread_lifetime)
+    # Subreddit -> {post_regex: compiled regex}
+    self._targets = collections.defaultdict(dict)
+    # "subreddit\npost_regex" -> {id, resolved_at, created_utc}
+    self._entries = FileCache(get_cache_path(vars, 'submissions'))
+    self._subreddit_locks = collections.defaultdict(threading.Lock)
+
+  def register(self, subreddit, post_regex):
+    """Adds a target, so that it is resolved along with the subreddit's other targets."""
+    if post_regex not in self._targets[subreddit]:
+      self._targets[subreddit][post_regex] = re.compile(post_regex)
+
+  def resolve(self, reddit, subreddit, post_regex, vars):
+    """Returns the submission matching post_regex in the subreddit's hot posts, or None."""
+    submission_id = self.lookup(subreddit, post_regex)
+    if submission_id is None:
+      # Only one task lists a subreddit at a time. The others wait for it and reuse its results.
+      with self._subreddit_locks[subreddit]:
+        submission_id = self.lookup(subreddit, post_regex)
+        if submission_id is None:
+          submission_id = self.match_listing(subreddit, reddit.subreddit(subreddit).hot(limit=10), vars).get(post_regex)
+    if submission_id is None:
+      return None
+    logger.log("Resolved submission: %s", submission_id, args=vars)
+    # Lazy submission: no API call until its comments are accessed.
+    return reddit.submission(id = submission_id)
+
+  def lookup(self, subreddit, post_regex):
+    """Registers the target and returns its cached submission id, or None if the subreddit has to be listed."""
+    self.register(subreddit, post_regex)
+    entry = self._get_fresh_entry(_get_key(subreddit, post_regex))
+    return entry['id'] if entry is not None else None
+
+  def _get_fresh_entry(self, key):
+    entry = self._entries.get(key)
+    now = time.time()
+    if (entry is None
+        or now - entry['resolved_at'] > self.ttl
+        or (now - entry['created_utc'] > self.thread_lifetime
+          and entry['resolved_at'] - entry['created_utc'] <= self.thread_lifetime)):
+      return None
+    return entry
+
+  def match_listing(self, subreddit, submissions, vars):
+    """Caches the first of the subreddit's listed submissions that matches each of its targets.
+
+    Returns a dict mapping(post_regex -> submission id) of the targets that matched.
+    """
+    targets = dict(self._targets[subreddit])
+    matches = dict()
+    for submission in submissions:
+      for post_regex, compiled_regex in targets.items():
+        if post_regex not in matches and compiled_regex.search(submission.title):
+          logger.log("Successfully found submission: %s (%s)", submission.title, submission.permalink, args=vars)
+          matches[post_regex] = {
+            'id': submission.id,
+            'resolved_at': time.time(),
+            'created_utc': submission.created_utc,
+          }
+    self._entries.update({
+      _get_key(subreddit, post_regex): entry for post_regex, entry in matches.items()})
+    return {post_regex: entry['id'] for post_regex, entry in matches.items()}
+
+def _get_key(subreddit, post_regex):
+  return f"{subreddit}\n{post_regex}"
@@ -0,0 +1,65 @@
+import unittest
+
+from contribution_store import ContributionStore, SECONDS_PER_DAY
+from user import Contribution, User
+
+"""Checks that ContributionStore keeps its daily totals in sync with the latest counts of each thread.
+
+Run with `python3 -m unittest` (or pytest) from the repository's root.
+"""
+
+TODAY = 20000
+NOW = TODAY * SECONDS_PER_DAY + 3600
+
+def make_users(counts):
+  """Returns a users_by_name dict from a dict(name -> (num_replies, num_questions))."""
+  return {
+    name: User(
+      name,
+      questions=[Contribution(f"{name}_q{i}") for i in range(num_questions)],
+      replies=[Contribution(f"{name}_r{i}") for i in range(num_replies)])
+    for name, (num_replies, num_questions) in counts.items()}
+
+class ContributionStoreTest(unittest.TestCase):
+  def setUp(self):
+    self.store = ContributionStore(':memory:')
+
+  def save(self, submission_id, day, counts, series='series'):
+    self.store.save_thread(series, submission_id, day * SECONDS_PER_DAY + 60, make_users(counts))
+
+  def get_daily_counts(self, day):
+    return {
+      user: (num_replies, num_questions)
+      for user, num_replies, num_questions in self.store._connection.execute(
+        "SELECT user, num_replies, num_questions FROM daily_counts WHERE series = 'series' AND day = ?", (day,))}
+
+  def test_resaving_a_thread_applies_the_difference(self):
+    self.save('thread1', TODAY, {'alice': (3, 1), 'bob': (2, 0)})
+    self.save('thread2', TODAY, {'alice': (1, 0)})
+    self.assertEqual(self.get_daily_counts(TODAY), {'alice': (4, 1), 'bob': (2, 0)})
+
+    # Counts can go down (e.g. deleted replies), and users can disappear from a thread.
+    self.save('thread1', TODAY, {'alice': (1, 2), 'carol': (4, 0)})
+    self.assertEqual(self.get_daily_counts(TODAY), {'alice': (2, 2), 'bob': (0, 0), 'carol': (4, 0)})
+
+    # Saving the same counts again changes nothing.
+    self.save('thread1', TODAY, {'alice': (1, 2), 'carol': (4, 0)})
+    self.assertEqual(self.get_daily_counts(TODAY), {'alice': (2, 2), 'bob': (0, 0), 'carol': (4, 0)})
+
+  def test_weekly_totals_only_include_threads_from_the_window(self):
+    self.save('today', TODAY, {'alice': (3, 0), 'bob': (2, 0)})
+    self.save('today', TODAY, {'alice': (1, 0), 'carol': (4, 0)})
+    self.save('six_days_ago', TODAY - 6, {'alice': (5, 0)})
+    self.save('seven_days_ago', TODAY - 7, {'carol': (10, 0)})
+    self.save('other_series', TODAY, {'bob': (50, 0)}, series='other')
+
+    # bob's replies were removed from the only thread bob replied to, so bob isn't listed at all.
+    self.assertEqual(self.store.get_most_helpful('series', 7, 10, now=NOW), [('alice', 6), ('carol', 4)])
+    self.assertEqual(self.store.get_most_helpful('series', 8, 10, now=NOW), [('carol', 14), ('alice', 6)])
+    self.assertEqual(self.store.get_most_helpful('series', 8, 1, now=NOW), [('carol', 14)])
+    # A day later, the thread from six days ago falls out of the window.
+    self.assertEqual(
+      self.store.get_most_helpful('series', 7, 10, now=NOW + SECONDS_PER_DAY), [('carol', 4), ('alice', 1)])
+
+if __name__ == '__main__':
+  unittest.main()
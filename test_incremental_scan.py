@@ -0,0 +1,84 @@
+import unittest
+
+import benchmark
+import fake_reddit
+
+from main import Task
+from scan_state import ScanState
+
+"""Checks that incremental scans (--state_path) count the same comments as full scans.
+
+Run with `python3 -m unittest` (or pytest) from the repository's root.
+"""
+
+def get_vars(reddit, **overrides):
+  vars = benchmark.get_benchmark_vars(reddit)
+  vars.max_expansions = None
+  vars.max_expansion_seconds = None
+  for name, value in overrides.items():
+    setattr(vars, name, value)
+  return vars
+
+def summarize(users_by_name):
+  """Returns the per-user counts that the rankings are computed from."""
+  return {
+    name: (len(user.questions), len(user.replies), user.num_replies_to_questions)
+    for name, user in users_by_name.items()}
+
+class IncrementalScanTest(unittest.TestCase):
+  def setUp(self):
+    self.reddit = fake_reddit.FakeReddit()
+    fake_reddit.generate_submission(self.reddit, 3000)
+    self.scan_state = ScanState(':memory:')
+
+  def full_scan(self):
+    task = Task(get_vars(self.reddit), client_pool=fake_reddit.FakeClientPool(self.reddit))
+    top_level_comments = task.get_top_level_comments(self.reddit.submission('fake'))
+    users_by_name = task.construct_dict_from_top_level_comments(top_level_comments)
+    return summarize(task.scan_replies_to_top_level_comments(users_by_name))
+
+  def incremental_scan(self, **overrides):
+    task = Task(get_vars(self.reddit, **overrides), self.scan_state, fake_reddit.FakeClientPool(self.reddit))
+    _, users_by_name = task.scan_new_comments(self.reddit.submission('fake'))
+    return task, summarize(users_by_name)
+
+  def add_reply(self, comment_id, parent_id, author='late_helper'):
+    self.reddit.add_comment('fake', {'id': comment_id, 'author': author, 'parent_id': parent_id, 'body': 'Answer'})
+
+  def get_hidden_question_ids(self):
+    """Returns the ids of top-level comments that Reddit hides behind "load more" stubs."""
+    submission = self.reddit.submission('fake')
+    return [
+      hidden_comment.id
+      for stub in submission.comments
+      if isinstance(stub, fake_reddit.FakeMoreComments)
+      for hidden_comment in stub.comments()]
+
+  def test_matches_full_scan_after_replies_under_hidden_questions(self):
+    self.assertEqual(self.incremental_scan()[1], self.full_scan())
+    question_ids = self.get_hidden_question_ids()
+    self.add_reply('late1', f"t1_{question_ids[0]}")
+    self.add_reply('late2', f"t1_{question_ids[-1]}")
+    # A reply nested under a hidden reply isn't counted, but mustn't break the scan either.
+    self.add_reply('late3', 't1_late1', author='someone_else')
+
+    self.assertEqual(self.incremental_scan()[1], self.full_scan())
+    self.assertIn('late_helper', self.full_scan())
+
+  def test_budgeted_scans_converge_to_full_scan(self):
+    self.incremental_scan()
+    question_ids = self.get_hidden_question_ids()
+    for i, question_id in enumerate(question_ids[::200]):
+      self.add_reply(f"late{i}", f"t1_{question_id}")
+
+    # Each run re-checks a different stub, so every stub is expanded once after this many runs.
+    num_stubs = sum(
+      isinstance(comment, fake_reddit.FakeMoreComments) for comment in self.reddit.submission('fake').comments)
+    for _ in range(num_stubs):
+      task, users = self.incremental_scan(max_expansions=1)
+    self.assertEqual(users, self.full_scan())
+    # The stubs that are left over only hide comments that were seen, so the results aren't partial.
+    self.assertEqual(task.num_unexpanded_stubs, 0)
+
+if __name__ == '__main__':
+  unittest.main()
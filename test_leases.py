@@ -0,0 +1,65 @@
+import os
+import tempfile
+import time
+import unittest
+
+from leases import LeaseStore
+
+"""Checks that LeaseStore.claim gives every post exactly one owner and balances posts between workers.
+
+Run with `python3 -m unittest` (or pytest) from the repository's root.
+"""
+
+class LeaseStoreTest(unittest.TestCase):
+  def setUp(self):
+    directory = tempfile.TemporaryDirectory()
+    self.addCleanup(directory.cleanup)
+    self.path = os.path.join(directory.name, 'leases.db')
+
+  def start_worker(self, num_posts, worker_id):
+    leases = LeaseStore(self.path, 60, num_posts, worker_id)
+    leases.start()
+    self.addCleanup(leases.stop)
+    return leases
+
+  def test_two_stores_on_one_file_never_share_a_post(self):
+    first = self.start_worker(2, 'first')
+    second = self.start_worker(2, 'second')
+
+    self.assertTrue(first.claim('post'))
+    self.assertFalse(second.claim('post'))
+    self.assertTrue(first.holds('post'))
+    self.assertFalse(second.holds('post'))
+
+    first.release('post')
+    self.assertTrue(second.claim('post'))
+    self.assertFalse(first.claim('post'))
+
+  def test_releases_posts_above_fair_share_when_a_worker_joins(self):
+    first = self.start_worker(2, 'first')
+    self.assertTrue(first.claim('post1'))
+    self.assertTrue(first.claim('post2'))
+
+    second = self.start_worker(2, 'second')
+    # Each worker's share is now one post, so the first worker hands one over on its next claim.
+    self.assertFalse(first.claim('post1'))
+    self.assertFalse(first.holds('post1'))
+    self.assertTrue(second.claim('post1'))
+    self.assertTrue(first.claim('post2'))
+    self.assertFalse(second.claim('post2'))
+
+  def test_takes_over_after_the_owner_stops_renewing(self):
+    # Neither worker is started, so the lease isn't renewed in the background.
+    first = LeaseStore(self.path, 0.2, 1, 'first')
+    second = LeaseStore(self.path, 0.2, 1, 'second')
+    self.assertTrue(first.claim('post'))
+    self.assertFalse(second.claim('post'))
+
+    time.sleep(0.3)
+    self.assertFalse(first.holds('post'))
+    self.assertTrue(second.claim('post'))
+    self.assertEqual(second.acquired_at.keys(), {'post'})
+    self.assertFalse(first.claim('post'))
+
+if __name__ == '__main__':
+  unittest.main()
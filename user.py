@@ -1,36 +1,61 @@
 import utils
 
+class Contribution:
+    """Compact record of a question or reply, detached from the PRAW comment it was built from."""
+    __slots__ = ('id', 'permalink', 'parent_id', 'author', 'num_replies', 'created_utc')
+
+    def __init__(self, id, permalink=None, parent_id=None, author=None, num_replies=0, created_utc=None):
+        self.id = id
+        self.permalink = permalink
+        self.parent_id = parent_id
+        self.author = author
+        # Number of counted replies (only tracked for questions).
+        self.num_replies = num_replies
+        # Unknown for contributions restored from a ScanState file written before it was saved.
+        self.created_utc = created_utc
+
+    @classmethod
+    def from_comment(cls, comment):
+        return cls(
+            id = comment.id,
+            permalink = comment.permalink,
+            parent_id = comment.parent_id,
+            author = comment.author.name if comment.author else None,
+            created_utc = comment.created_utc)
+
 class User:
     """Represents a user participating in the daily thread."""
-    def __init__(self, name, questions=[], replies=[], num_replies_to_questions=0):
+    __slots__ = ('name', 'questions', 'replies', 'num_replies_to_questions')
+
+    def __init__(self, name, questions=None, replies=None, num_replies_to_questions=0):
         self.name = name
-        self.questions = questions
-        self.replies = replies
+        self.questions = questions if questions is not None else []
+        self.replies = replies if replies is not None else []
         self.num_replies_to_questions = num_replies_to_questions
 
     def __str__(self):
         string = f"""{self.name}: relative_contribution={self.relative_contribution()}
-        \t+num_replies={len(self.replies)} 
-        \t-num_replies_to_questions={self.num_replies_to_questions} 
+        \t+num_replies={len(self.replies)}
+        \t-num_replies_to_questions={self.num_replies_to_questions}
         \t-num_questions={len(self.questions)}"""
         for summary in self._question_summaries():
             string += f"\n\t\tQuestion: {summary}"
-        for summary in self._reply_summaries():
+        for summary in self.reply_summaries():
             string += f"\n\t\tReply: {summary}"
         return string
 
     @classmethod
     def combine(cls, user1, user2):
+        """Merges user2's contributions into user1 and returns user1."""
         if user1.name != user2.name:
             print(f"User1.name({user1.name}) is not equal to User2.name({user2.name})!!!!")
-        return cls(
-            name = user1.name,
-            questions = user1.questions + user2.questions,
-            replies = user1.replies + user2.replies,
-            num_replies_to_questions = user1.num_replies_to_questions + user2.num_replies_to_questions)
+        user1.questions.extend(user2.questions)
+        user1.replies.extend(user2.replies)
+        user1.num_replies_to_questions += user2.num_replies_to_questions
+        return user1
 
-    def add_question(self, comment):
-        self.questions.append(comment)
+    def add_question(self, contribution):
+        self.questions.append(contribution)
 
     def get_profile_link_string(self):
         return f"[{self.name}](https://reddit.com/user/{self.name}/)"
@@ -38,16 +63,16 @@ class User:
     def _question_summaries(self):
         summaries = []
         for question in self.questions:
-            summaries.append(utils.get_abbreviated_comment(question))
+            summaries.append(utils.get_contribution_link(question))
         return summaries
 
-    def add_reply(self, comment):
-        self.replies.append(comment)
+    def add_reply(self, contribution):
+        self.replies.append(contribution)
 
     def reply_summaries(self):
         summaries = []
         for reply in self.replies:
-            summaries.append(utils.get_abbreviated_comment(reply))
+            summaries.append(utils.get_contribution_link(reply))
         return summaries
 
     def num_replies(self):
@@ -12,55 +12,56 @@ def get_abbreviated_comment(comment):
     return (re.sub(r"\s+", " ", comment.body[0 : 20], flags=re.UNICODE) +
         f" - https://reddit.com{comment.permalink}")
 
+def get_contribution_link(contribution):
+  """Returns a link to a question or reply (see user.Contribution)."""
+  return f"https://reddit.com{contribution.permalink}"
+
 def get_most_helpful_summary(users):
   """Returns a string summary of the most helpful users, formatted for Reddit.
 
-  Only includes the top 10 most helpful users and only incldues users who have
-  answered at least 1 question.
+  Expects the users to already be ranked (see leaderboard.py).
   """
   summary = ("User | # Helped"
             "\n----|:-----:|:-----:|")
-  for user in users[:10]:
-    if user.num_replies() == 0:
-      continue;
-    else:
-      summary += f"\n{user.get_profile_link_string()} | {user.num_replies()}"
+  for user in users:
+    summary += f"\n{user.get_profile_link_string()} | {user.num_replies()}"
   return summary
 
 def get_most_helpful_without_replies_summary(users, reply_threshold):
-  filtered_users = []
-  # Filter the list of helpful users to only those with top-level comments
-  # that are under the reply_threshold
-  for user in users:
-    if len(filtered_users) >= 10:
-      break
-    questions_that_could_use_some_love = []
-    for question in user.questions:
-      replies = question.replies
-      if len(replies) < reply_threshold:
-        # Only include questions under the threshold
-        questions_that_could_use_some_love.append(question)
-    if len(questions_that_could_use_some_love) > 0:
-      filtered_users.append({
-        'name': user.get_profile_link_string(),
-        'num_helped': user.num_replies(),
-        'questions_that_could_use_some_love': questions_that_could_use_some_love
-      })
+  """Returns a string summary of helpful users whose own questions are under the reply_threshold.
 
-  # Produce the summary string
+  Expects the users to already be ranked (see leaderboard.py). Only links the questions that are
+  under the threshold.
+  """
   summary = ("User | # Helped | Questions that could use some love"
             "\n----|:-----:|:-----:|")
-  for user in filtered_users:
-    summary += f"\n{user['name']} | {user['num_helped']} | "
-    questions = user['questions_that_could_use_some_love']
+  for user in users:
+    summary += f"\n{user.get_profile_link_string()} | {user.num_replies()} | "
     question_strings = []
-    for i in range(len(questions)):
-      question = questions[i]
-      num_replies = len(question.replies)
-      question_strings.append(f"[{pluralize_replies(num_replies)}]({question.permalink})")
+    for question in user.questions:
+      if question.num_replies < reply_threshold:
+        # Only include questions under the threshold
+        question_strings.append(f"[{pluralize_replies(question.num_replies)}]({question.permalink})")
     summary += ", ".join(question_strings)
   return summary
 
+def get_relative_contribution_summary(users):
+  """Returns a string summary of the users who have given the most help relative to the help they've received."""
+  summary = ("User | # Helped | # Questions | # Replies received | Relative contribution"
+            "\n----|:-----:|:-----:|:-----:|:-----:|")
+  for user in users:
+    summary += (f"\n{user.get_profile_link_string()} | {user.num_replies()} | {len(user.questions)}"
+      f" | {user.num_replies_to_questions} | {user.relative_contribution()}")
+  return summary
+
+def get_window_summary(totals):
+  """Returns a string summary of (name, num_replies) pairs that span several threads, formatted for Reddit."""
+  summary = ("User | # Helped"
+            "\n----|:-----:|:-----:|")
+  for name, num_replies in totals:
+    summary += f"\n[{name}](https://reddit.com/user/{name}/) | {num_replies}"
+  return summary
+
 def pluralize_replies(num_replies):
   if num_replies == 1:
     return "1 reply"
@@ -42,6 +42,15 @@ def load_variables():
     type = parse_posts,
     help = "JSON string describing one or more posts to target. See README for examples.")
 
+  parser.add_argument(
+    "--resolution_ttl",
+    default = os.environ.get('resolution_ttl') or 3600,
+    help = "How long (in seconds) a post found with subreddit and post_regex is reused before searching for it again.")
+  parser.add_argument(
+    "--thread_lifetime",
+    default = os.environ.get('thread_lifetime') or 86400,
+    help = "How old (in seconds) a post found with subreddit and post_regex may get before searching for a newer one.")
+
   # Arguments that alter how a post is processed
   parser.add_argument(
     "--reply_threshold",
@@ -60,13 +69,120 @@ def load_variables():
   parser.add_argument(
     "--interval",
     default = os.environ.get('interval') or 600,
-    help = "The interval (in seconds) the bot will wait between scans. Note: this only affects the comment. Scheduling is actually handled by the Heroku Scheduler.")
+    help = "The interval (in seconds) the bot will wait between scans. Note: unless --daemon is set, this only affects the comment and scheduling is actually handled by the Heroku Scheduler.")
+  parser.add_argument(
+    "--rankings",
+    default = os.environ.get('rankings') or 'most_helpful,under_answered_helpers',
+    help = "Comma-separated rankings to include in the results, in order. Any of `most_helpful`, `under_answered_helpers`, `relative_contribution`, `weekly_most_helpful` and `monthly_most_helpful`.")
+  parser.add_argument(
+    "--leaderboard_size",
+    default = os.environ.get('leaderboard_size') or 10,
+    help = "The maximum number of users listed in each ranking.")
+
+  # Arguments that alter how the bot runs
+  parser.add_argument(
+    "--daemon",
+    default = os.environ.get('daemon') or False,
+    help = "Keeps the process alive and scans each post every `interval` seconds, instead of scanning each post once and exiting.")
+  parser.add_argument(
+    "--min_interval",
+    default = os.environ.get('min_interval'),
+    help = "In daemon mode, the shortest interval (in seconds) between scans of a busy post. Defaults to --interval.")
+  parser.add_argument(
+    "--max_interval",
+    default = os.environ.get('max_interval'),
+    help = "In daemon mode, the longest interval (in seconds) between scans of an idle post. Defaults to --interval.")
+  parser.add_argument(
+    "--comments_per_run",
+    default = os.environ.get('comments_per_run') or 20,
+    help = "In daemon mode, the number of new comments per scan that each post's interval is adjusted towards, within --min_interval and --max_interval.")
+  parser.add_argument(
+    "--stream",
+    default = os.environ.get('stream') or False,
+    help = "Keeps the process alive and follows the comment stream of each post's subreddit, updating the results every `interval` seconds.")
+  parser.add_argument(
+    "--jitter",
+    default = os.environ.get('jitter') or 30,
+    help = "In daemon mode, the maximum number of seconds each scan is randomly delayed by, so that posts aren't all scanned at the same moment.")
+  parser.add_argument(
+    "--engine",
+    default = os.environ.get('engine') or 'threads',
+    help = "Either `threads`, which scans posts on a pool of --workers threads, `processes`, which scans posts on a pool of --workers processes, or `asyncio`, which scans every post concurrently in a single event loop.")
+  parser.add_argument(
+    "--workers",
+    default = os.environ.get('workers') or 4,
+    help = "With --engine threads or processes, the maximum number of posts scanned at once.")
+  parser.add_argument(
+    "--task_timeout",
+    default = os.environ.get('task_timeout'),
+    help = "With --engine threads or processes, the number of seconds after which a post's scan is reported as failed (and its process is terminated).")
+  parser.add_argument(
+    "--lease_path",
+    default = os.environ.get('lease_path'),
+    help = "Path to a SQLite file shared by several instances of the bot, which split the posts between them (see leases.py).")
+  parser.add_argument(
+    "--lease_ttl",
+    default = os.environ.get('lease_ttl') or 120,
+    help = "With --lease_path, the number of seconds after which the posts of an instance that stopped renewing its leases are taken over by the others.")
+  parser.add_argument(
+    "--concurrency",
+    default = os.environ.get('concurrency') or 5,
+    help = "With --engine asyncio, the maximum number of Reddit fetches that may be in flight at once.")
+  parser.add_argument(
+    "--requests_per_minute",
+    default = os.environ.get('requests_per_minute') or 60,
+    help = "The maximum number of Reddit API requests per minute, shared by all of the bot's posts.")
+  parser.add_argument(
+    "--request_burst",
+    default = os.environ.get('request_burst') or 10,
+    help = "The number of Reddit API requests that may be made back-to-back before --requests_per_minute kicks in.")
+  parser.add_argument(
+    "--cache_dir",
+    default = os.environ.get('cache_dir'),
+    help = "Directory where the bot caches data between runs (e.g. the posts found with subreddit and post_regex and its OAuth token).")
+  parser.add_argument(
+    "--state_path",
+    default = os.environ.get('state_path'),
+    help = "Path to a SQLite file used to checkpoint scans, so that each run only processes comments that previous runs haven't seen.")
+  parser.add_argument(
+    "--history_path",
+    default = os.environ.get('history_path'),
+    help = "Path to a SQLite file where the bot saves each thread's per-user counts, for rankings that span several threads (e.g. weekly_most_helpful).")
+  parser.add_argument(
+    "--snapshot_dir",
+    default = os.environ.get('snapshot_dir'),
+    help = "Directory where each run writes a columnar snapshot of its thread's question/reply graph (see snapshot.py).")
+  parser.add_argument(
+    "--skip_unchanged",
+    default = os.environ.get('skip_unchanged') or False,
+    help = "Checks each post's comment count first (1 cheap API request) and skips the run if it hasn't changed since the last run.")
+  parser.add_argument(
+    "--max_expansions",
+    default = os.environ.get('max_expansions'),
+    help = "With --state_path, the maximum number of \"load more\" stubs (1 API request each) expanded per run. The rest are expanded by later runs.")
+  parser.add_argument(
+    "--max_expansion_seconds",
+    default = os.environ.get('max_expansion_seconds'),
+    help = "With --state_path, the maximum number of seconds spent expanding \"load more\" stubs per run. The rest are expanded by later runs.")
+
+  parser.add_argument(
+    "--metrics_path",
+    default = os.environ.get('metrics_path'),
+    help = "Path to a file where each task writes per-stage timings, API request counts and rate limit headroom at the end of every run.")
+  parser.add_argument(
+    "--metrics_format",
+    default = os.environ.get('metrics_format') or 'json',
+    help = "Either `json`, which appends one JSON object per run to --metrics_path, or `prometheus`, which rewrites it as a Prometheus text file with the latest run of each post.")
 
   # Other (debug) arguments
   parser.add_argument(
     "--debug",
     default = False,
     help = "Prints additional debug messages that show the task's progress.")
+  parser.add_argument(
+    "--log_format",
+    default = os.environ.get('log_format') or 'text',
+    help = "Either `text`, which logs human-readable lines, or `json`, which logs one JSON object per line.")
   parser.add_argument(
     "--answer_username",
     default = os.environ.get('answer_username'),